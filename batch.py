@@ -0,0 +1,145 @@
+from core import RUNES
+from core import RUNE_INDICES
+from core import GP_PRIMES
+from transformers import AutokeyMode
+from transformers import get_interrupt_mask
+from numtheory import get_tables
+import numpy as np
+
+# Every Shift (by 0 to 28), without and then with Atbash after it, in the order of the rows of a variants matrix
+SHIFT_ATBASH_VARIANTS = [ (shift, atbash) for atbash in (False, True) for shift in range(len(RUNES)) ]
+
+def keys_to_matrix(keys):
+    """
+        Turns Runic keys into a zero-padded matrix of key indices and an array of key lengths.
+    """
+
+    # Pad all keys to the longest key
+    assert len(keys) > 0, Exception('No keys')
+    lengths = np.array([ len(key) for key in keys ], dtype=np.int64)
+    assert lengths.min() > 0, Exception('Empty key')
+    key_matrix = np.zeros((len(keys), lengths.max()), dtype=np.int64)
+    for key_index, key in enumerate(keys):
+        key_matrix[key_index, :len(key)] = [ RUNE_INDICES[rune] for rune in key ]
+    return key_matrix, lengths
+
+def vigenere_decrypt_batch(processed_text, keys, interrupt_indices=set()):
+    """
+        Decrypts the processed text with each of the given Runic keys.
+        Returns an N by L matrix of decrypted indices, where N is the number of keys and L is the number of runes.
+    """
+
+    # Tile each key over the non-interrupters
+    indices = processed_text.view_indices().astype(np.int64)
+    mask = get_interrupt_mask(len(indices), interrupt_indices)
+    key_matrix, lengths = keys_to_matrix(keys)
+    columns = np.arange(mask.sum())[None, :] % lengths[:, None]
+    tiled_keys = key_matrix[np.arange(len(keys))[:, None], columns]
+
+    # Substract keys from all non-interrupters and keep interrupters as they are
+    result = np.empty((len(keys), len(indices)), dtype=np.uint8)
+    result[:, ~mask] = indices[~mask]
+    result[:, mask] = (indices[mask][None, :] - tiled_keys) % len(RUNES)
+    return result
+
+def autokey_decrypt_batch(processed_text, keys, mode, use_gp=False, interrupt_indices=set()):
+    """
+        Decrypts the processed text with Autokey (see AutokeyTransformer) with each of the given Runic keys, advancing all keys together one rune at a time.
+        Returns an N by L matrix of decrypted indices, where N is the number of keys and L is the number of runes.
+    """
+
+    # Mobius modes also skip runes at positions where the Mobius function is zero, and choose the extension by its value elsewhere
+    indices = processed_text.view_indices().astype(np.uint8)
+    mask = get_interrupt_mask(len(indices), interrupt_indices)
+    if mode in (AutokeyMode.ALT_MOBIUS_START_PLAINTEXT, AutokeyMode.ALT_MOBIUS_START_CIPHERTEXT):
+        mob_values = get_tables().get_mobius(range(1, len(indices) + 1))
+        mask &= mob_values != 0
+        extend_to_plaintext = (mob_values == (1 if mode == AutokeyMode.ALT_MOBIUS_START_PLAINTEXT else -1))[mask].tolist()
+    else:
+        extend_to_plaintext = [ mode in (AutokeyMode.PLAINTEXT, AutokeyMode.ALT_START_PLAINTEXT) ] * int(mask.sum())
+        if mode in (AutokeyMode.ALT_START_PLAINTEXT, AutokeyMode.ALT_START_CIPHERTEXT):
+            extend_to_plaintext = [ value != bool(step % 2) for step, value in enumerate(extend_to_plaintext) ]
+
+    # Running keys are kept one column per key, where the keystream of each key is extended right after its own key
+    key_matrix, lengths = keys_to_matrix(keys)
+    positions = np.flatnonzero(mask).tolist()
+    running_keys = np.zeros((lengths.max() + len(positions), len(keys)), dtype=np.uint8)
+    running_keys[:key_matrix.shape[1]] = key_matrix.T
+    extension = np.array(GP_PRIMES if use_gp else range(len(RUNES)), dtype=np.int64) % len(RUNES)
+    extension = extension.astype(np.uint8)
+    columns = np.arange(len(keys))
+    ciphertext_extensions = np.cumsum([ not value for value in extend_to_plaintext ]).tolist()
+
+    # Decrypt all keys at once, one rune at a time, where ciphertext extension takes the next ciphertext rune regardless of interrupters
+    result = np.empty((len(indices), len(keys)), dtype=np.uint8)
+    result[~mask] = indices[~mask, None]
+    for step, position in enumerate(positions):
+        decrypted = (indices[position] + len(RUNES) - running_keys[step]) % len(RUNES)
+        result[position] = decrypted
+        running_keys[lengths + step, columns] = extension[decrypted] if extend_to_plaintext[step] else extension[indices[ciphertext_extensions[step] - 1]]
+
+    # One row per key
+    return np.ascontiguousarray(result.T)
+
+def shift_atbash_variants_batch(processed_text):
+    """
+        Applies every Shift, with and without Atbash after it, to the processed text at once, as they are all permutations of the alphabet.
+        Returns a 58 by L matrix of indices, with a row per variant in SHIFT_ATBASH_VARIANTS.
+    """
+
+    # Map every rune through a table of all variants
+    alphabet = np.arange(len(RUNES))
+    table = np.array([ (len(RUNES) - 1 - (alphabet + shift) % len(RUNES)) if atbash else (alphabet + shift) % len(RUNES) for shift, atbash in SHIFT_ATBASH_VARIANTS ], dtype=np.uint8)
+    return table[:, processed_text.view_indices()]
+
+def score_shift_atbash_variants(processed_text, lexicon, model=None):
+    """
+        Scores every Shift, with and without Atbash after it, of the processed text at once.
+        Returns a dictionary of the variants matrix (see shift_atbash_variants_batch), the number of words at the beginning of each variant that are in the lexicon
+        and, if a quadgram model is given, the quadgram score of each variant.
+        The rune IoC is the same for all variants.
+    """
+
+    # Score all rows in bulk
+    variants = shift_atbash_variants_batch(processed_text)
+    return {
+        'variants' : variants,
+        'word_matches' : get_first_non_wordlist_word_index_batch(variants, processed_text.get_word_spans(), lexicon),
+        'quadgram_scores' : None if model is None else model.score_batch(variants)
+    }
+
+def get_rune_ioc_batch(matrix):
+    """
+        Returns the rune IoC of each row of the given matrix of indices.
+    """
+
+    # Count all letters of all rows at once by giving each row its own range of bins
+    rows, length = matrix.shape
+    if length < 2:
+        return np.zeros(rows)
+    offsets = np.arange(rows, dtype=np.int64)[:, None] * len(RUNES)
+    counts = np.bincount((matrix + offsets).ravel(), minlength=rows * len(RUNES)).reshape(rows, len(RUNES))
+
+    # Calculate the IoC
+    return (counts * (counts - 1)).sum(axis=1) / (length * (length - 1) / len(RUNES))
+
+def get_first_non_wordlist_word_index_batch(matrix, word_spans, lexicon):
+    """
+        Finds the first Runic word that is not in the given lexicon, for each row of the given matrix of indices.
+        Word spans are taken from the processed text the matrix was decrypted from.
+    """
+
+    # Assume all words are in the wordlist, just like the single text version does
+    result = np.full(len(matrix), len(word_spans), dtype=np.int64)
+
+    # Only keep checking rows that matched all words so far
+    alive = np.arange(len(matrix))
+    for word_index, (start, end) in enumerate(word_spans):
+        found = lexicon.contains_rows(matrix[alive, start:end])
+        result[alive[~found]] = word_index
+        alive = alive[found]
+        if len(alive) == 0:
+            break
+
+    # Return result
+    return result
@@ -1,4 +1,7 @@
+from collections import OrderedDict
+from collections import Counter
 import string
+import numpy as np
 
 # Pages
 PAGE_NAMES = [
@@ -75,13 +78,42 @@ LATIN = [ 'F', 'V', 'TH', 'O', 'R', 'C', 'G', 'W', 'H', 'N', 'I', 'J', 'EO', 'P'
 PUNCT = { '.': '.\n', '-': ' ', '%': '\n\n', '/': '', '&' : '\n', '\n' : '' }
 GP_PRIMES = [ 2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97, 101, 103, 107, 109 ]
 
+# Gematria index of each rune
+RUNE_INDICES = { rune: index for index, rune in enumerate(RUNES) }
+
+# Runes and latin by Gematria index, for translating index arrays at once
+RUNES_ARRAY = np.array(RUNES, dtype=object)
+LATIN_ARRAY = np.array(LATIN, dtype=object)
+
+# Number of times each uppercase latin letter appears in the latin of each rune
+LATIN_LETTER_COUNTS = np.array([ [ latin.count(letter) for letter in string.ascii_uppercase ] for latin in LATIN ], dtype=np.int64)
+
+# Maximum number of page layouts kept in the cache
+MAX_CACHED_LAYOUTS = 256
+
+def runes_to_indices(runes):
+    """
+        Translates runes to a Gematria indices array, ignoring non-runes.
+    """
+
+    # Only take runes and translate
+    return np.array([ RUNE_INDICES[rune] for rune in runes if rune in RUNE_INDICES ], dtype=np.uint8)
+
+def indices_to_runes(indices):
+    """
+        Translates Gematria indices to a list of runes.
+    """
+
+    # Translate each index
+    return [ RUNES[i] for i in np.asarray(indices).tolist() ]
+
 def runes_to_gp_primes(runes):
     """
         Translates runes to primes.
     """
 
     # Only take runes and translate
-    return [ GP_PRIMES[RUNES.index(rune)] for rune in runes if rune in RUNES ]
+    return [ GP_PRIMES[RUNE_INDICES[rune]] for rune in runes if rune in RUNE_INDICES ]
 
 def latin_to_runes(latin):
     """
@@ -113,6 +145,97 @@ def latin_to_runes(latin):
     # Return result
     return s
 
+class PageLayout(object):
+    """
+        The layout of an original text: where its runes are, what comes between them and where words and sentences end.
+        Built once per text and shared by all processed texts of it, so rendering is just a join of the template with the runes.
+    """
+
+    def __init__(self, rune_text):
+        """
+            Parses the given text.
+        """
+
+        # Split the text to the non-rune segments between runes, both as they are and with punctuation translated
+        raw_segments = [ [] ]
+        indices = []
+        for c in rune_text:
+            if c in RUNE_INDICES:
+                indices.append(RUNE_INDICES[c])
+                raw_segments.append([])
+            else:
+                raw_segments[-1].append(c)
+        raw_segments = [ ''.join(segment) for segment in raw_segments ]
+        punct_segments = [ ''.join([ PUNCT.get(c, c) for c in segment ]) for segment in raw_segments ]
+
+        # Templates have the segments in even slots and runes go in odd slots
+        self._templates = { False: [ None ] * (2 * len(indices) + 1), True: [ None ] * (2 * len(indices) + 1) }
+        self._templates[False][0::2] = raw_segments
+        self._templates[True][0::2] = punct_segments
+
+        # Count the latin letters that are not runes, which appear as they are in the latin translation
+        segment_letters = Counter(''.join(punct_segments))
+        self.segment_letter_counts = np.array([ segment_letters[letter] for letter in string.ascii_uppercase ], dtype=np.int64)
+
+        # The original indices are shared and must never change
+        self.indices = np.array(indices, dtype=np.uint8)
+        self.indices.flags.writeable = False
+
+        # Words end on every character that translates to a space or a period, and sentences end on periods
+        self.word_spans = []
+        self.word_tokens = []
+        self.sentence_spans = []
+        word_start = 0
+        sentence_start = 0
+        rune_index = 0
+        for c in rune_text:
+            if c in RUNE_INDICES:
+                rune_index += 1
+            elif ' ' in PUNCT.get(c, c) or '.' in PUNCT.get(c, c):
+                if rune_index > word_start:
+                    self.word_spans.append((word_start, rune_index))
+                    self.word_tokens.append((word_start, rune_index))
+                word_start = rune_index
+                if '.' in PUNCT.get(c, c):
+                    self.word_tokens.append(None)
+                    if rune_index > sentence_start:
+                        self.sentence_spans.append((sentence_start, rune_index))
+                    sentence_start = rune_index
+
+        # Add the last word and sentence
+        if rune_index > word_start:
+            self.word_spans.append((word_start, rune_index))
+            self.word_tokens.append((word_start, rune_index))
+        if rune_index > sentence_start:
+            self.sentence_spans.append((sentence_start, rune_index))
+
+    def render(self, values, punct_translation=True):
+        """
+            Renders the text with the given strings (one per rune) in place of the runes.
+        """
+
+        # Fill the rune slots of a copy of the template
+        result = self._templates[punct_translation][:]
+        result[1::2] = values
+        return ''.join(result)
+
+# Page layouts by original text, in least recently used order
+_LAYOUTS = OrderedDict()
+
+def get_page_layout(rune_text):
+    """
+        Gets the (shared) layout of the given original text.
+    """
+
+    # Get from the cache or parse
+    if rune_text in _LAYOUTS:
+        _LAYOUTS.move_to_end(rune_text)
+    else:
+        _LAYOUTS[rune_text] = PageLayout(rune_text)
+        while len(_LAYOUTS) > MAX_CACHED_LAYOUTS:
+            _LAYOUTS.popitem(last=False)
+    return _LAYOUTS[rune_text]
+
 class ProcessedText(object):
 
     def __init__(self, rune_text):
@@ -120,11 +243,14 @@ class ProcessedText(object):
             Creates an instance.
         """
 
-        # Save the original text
+        # Save the original text and its layout
         self._orig = rune_text[:]
+        self._layout = get_page_layout(self._orig)
 
-        # Save processes runes
-        self._processed_runes = [ c for c in self._orig if c in RUNES ]
+        # Save processed runes as read-only Gematria indices, which are replaced (never modified) and can therefore be shared
+        self._indices = self._layout.indices
+        self._runes = None
+        self._histogram = None
 
         # Currently not marked as unsolved
         self._is_unsolved = False
@@ -133,11 +259,16 @@ class ProcessedText(object):
     def from_processed_text(other):
         """
             Creates a new instance, "duplicating" the given instance.
+            The duplicate shares the original text, layout and runes with the given instance until either of them sets new runes.
         """
 
-        # Duplicate
-        pt = ProcessedText(other._orig)
-        pt._processed_runes = other._processed_runes[:]
+        # Duplicate without parsing again
+        pt = ProcessedText.__new__(ProcessedText)
+        pt._orig = other._orig
+        pt._layout = other._layout
+        pt._indices = other._indices
+        pt._runes = other._runes
+        pt._histogram = other._histogram
         pt._is_unsolved = other._is_unsolved
         return pt
 
@@ -150,8 +281,8 @@ class ProcessedText(object):
         # Performs the sum
         result = 0
         for rune in runes:
-            if rune in RUNES:
-                result += GP_PRIMES[RUNES.index(rune)]
+            if rune in RUNE_INDICES:
+                result += GP_PRIMES[RUNE_INDICES[rune]]
         return result
 
     def set_unsolved(self):
@@ -175,8 +306,18 @@ class ProcessedText(object):
             Gets the runes.
         """
 
-        # Returns the processed runes
-        return self._processed_runes[:]
+        # Returns a copy of the processed runes
+        return list(self.view_runes())
+
+    def view_runes(self):
+        """
+            Gets the runes as a read-only tuple, without copying.
+        """
+
+        # Translate once per set of runes
+        if self._runes is None:
+            self._runes = tuple(RUNES_ARRAY[self._indices].tolist())
+        return self._runes
     
     def set_runes(self, new_runes):
         """
@@ -184,21 +325,84 @@ class ProcessedText(object):
         """
 
         # Save processed runes
-        assert len(new_runes) == len(self._processed_runes), Exception(f'Length mismatch between new runes ({len(new_runes)}) and old runes ({len(self._processed_runes)})')
-        self._processed_runes = new_runes[:]
+        assert len(new_runes) == len(self._indices), Exception(f'Length mismatch between new runes ({len(new_runes)}) and old runes ({len(self._indices)})')
+        self.set_indices([ RUNE_INDICES[rune] for rune in new_runes ])
+
+    def get_indices(self):
+        """
+            Gets the Gematria indices of the runes.
+        """
+
+        # Returns a copy of the indices
+        return self._indices.copy()
+
+    def view_indices(self):
+        """
+            Gets the Gematria indices of the runes as a read-only array, without copying.
+        """
+
+        # Indices are never modified in place
+        return self._indices
+
+    def set_indices(self, new_indices, rune_map=None):
+        """
+            Save the Gematria indices of the runes.
+            If the new indices are known to be a permutation of the alphabet (rune_map[old] for each old index, in any order),
+            the rune histogram is updated instead of being counted again.
+        """
+
+        # Save a read-only copy of the indices
+        assert len(new_indices) == len(self._indices), Exception(f'Length mismatch between new indices ({len(new_indices)}) and old indices ({len(self._indices)})')
+        self._indices = np.array(new_indices, dtype=np.uint8)
+        self._indices.flags.writeable = False
+        self._runes = None
+
+        # Move histogram counts along the permutation, if there is one
+        if rune_map is None or self._histogram is None:
+            self._histogram = None
+        else:
+            histogram = np.zeros(len(RUNES), dtype=np.int64)
+            histogram[np.asarray(rune_map)] = self._histogram
+            histogram.flags.writeable = False
+            self._histogram = histogram
+
+    def get_rune_histogram(self):
+        """
+            Gets the number of times each rune appears, by Gematria index, as a read-only array.
+        """
+
+        # Count once per set of runes
+        if self._histogram is None:
+            self._histogram = np.bincount(self._indices, minlength=len(RUNES)).astype(np.int64)
+            self._histogram.flags.writeable = False
+        return self._histogram
 
     def get_rune_words(self, remove_periods=True):
         """
             Get Runic words.
         """
 
-        # Get the Runic text
-        text = self.get_rune_text()
+        # Join the runes of each word, with periods as words of their own unless removed
+        runes = self.view_runes()
         if remove_periods:
-            text = text.replace('.', ' ')
-        else:
-            text = text.replace('.', ' . ')
-        return [ word for word in ''.join([ c for c in text if c in RUNES or c in (' ', '.') ]).split(' ') if len(word) > 0 ]
+            return [ ''.join(runes[start:end]) for start, end in self._layout.word_spans ]
+        return [ '.' if token is None else ''.join(runes[token[0]:token[1]]) for token in self._layout.word_tokens ]
+
+    def get_word_spans(self):
+        """
+            Get the (start, end) rune positions of each Runic word, matching the words of get_rune_words.
+        """
+
+        # Taken from the layout
+        return list(self._layout.word_spans)
+
+    def get_sentence_spans(self):
+        """
+            Get the (start, end) rune positions of each sentence, where sentences end with periods.
+        """
+
+        # Taken from the layout
+        return list(self._layout.sentence_spans)
 
     def get_first_non_wordlist_word_index(self, wordlist):
         """
@@ -221,21 +425,8 @@ class ProcessedText(object):
             Gets the rune text.
         """
 
-        # Replace runes from the original with the newly processed runes
-        result = ''
-        rune_index = 0
-        for c in self._orig:
-            if c in RUNES:
-                result += self._processed_runes[rune_index]
-                rune_index += 1
-            else:
-                if punct_translation and c in PUNCT:
-                    result += PUNCT[c]
-                else:
-                    result += c
-
-        # Return result
-        return result
+        # Render the processed runes into the layout
+        return self._layout.render(self.view_runes(), punct_translation)
 
     def to_latin(self):
         """
@@ -245,47 +436,51 @@ class ProcessedText(object):
         # Translate to Latin unless unsolved
         if self._is_unsolved:
             return '<UNSOLVED>'
-        text = self.get_rune_text()
-        result = []
-        for c in text:
-            if c in RUNES:
-                result.append(LATIN[RUNES.index(c)])
-            else:
-                result.append(c)
-        return ''.join(result)
+        return self._layout.render(LATIN_ARRAY[self._indices].tolist())
 
     @staticmethod
-    def _get_ioc(text, alphabet):
+    def _get_ioc_from_histogram(histogram, alphabet_size):
         """
-            1-gram IoC calculation.
+            1-gram IoC calculation from the number of times each letter appears.
         """
 
-        # Take only alphabet letters
-        instance = [ c for c in text if c in alphabet ]
-
-        # Ignore zero-length
-        if len(instance) == 0 or len(alphabet) == 0:
+        # Ignore texts too short to have any pairs
+        total = int(histogram.sum())
+        if total < 2 or alphabet_size == 0:
             return 0.0
 
         # Calculate the IoC
-        s = sum([ instance.count(letter) * (instance.count(letter) - 1) for letter in alphabet ])
-        d = len(instance) * (len(instance) - 1) / len(alphabet)
+        s = int((histogram * (histogram - 1)).sum())
+        d = total * (total - 1) / alphabet_size
         return s / d
+
+    @staticmethod
+    def _get_ioc(text, alphabet):
+        """
+            1-gram IoC calculation.
+        """
+
+        # Count all letters in a single pass and take only alphabet letters
+        counts = Counter(text)
+        return ProcessedText._get_ioc_from_histogram(np.array([ counts[letter] for letter in alphabet ], dtype=np.int64), len(alphabet))
  
     def get_rune_ioc(self):
         """
             Returns the IoC for the runes.
         """
 
-        # Calculate IoC
-        return self.__class__._get_ioc(self._processed_runes, RUNES)
+        # Calculate IoC from the histogram
+        return self.__class__._get_ioc_from_histogram(self.get_rune_histogram(), len(RUNES))
 
-    
     def get_latin_ioc(self):
         """
             Returns the latin IoC.
         """
 
-        return self.__class__._get_ioc(self.to_latin(), string.ascii_uppercase)
-
+        # Unsolved texts do not have a latin translation
+        if self._is_unsolved:
+            return self.__class__._get_ioc(self.to_latin(), string.ascii_uppercase)
 
+        # Latin letters come from the runes and from latin already in the original text, so there is no need to render anything
+        histogram = self.get_rune_histogram() @ LATIN_LETTER_COUNTS + self._layout.segment_letter_counts
+        return self.__class__._get_ioc_from_histogram(histogram, len(string.ascii_uppercase))
@@ -0,0 +1,187 @@
+from core import RUNES
+from core import RUNE_INDICES
+from core import ProcessedText
+from core import latin_to_runes
+from keystreams import get_keystream
+from fragments import FragmentIndex
+from scoring import WordPrefixScorer
+from abc import ABC
+from abc import abstractmethod
+import itertools
+import numpy as np
+
+# Default number of keystream values searched for key fragments
+DEFAULT_KEYSTREAM_WINDOW = 4096
+
+# Default keystreams searched for key fragments, as names and parameters
+# Totients of Fibonacci numbers are left out as they require factoring huge numbers
+DEFAULT_KEYSTREAMS = [
+    ('primes', {}),
+    ('totient_primes', { 'tot_calls' : 1 }),
+    ('totient_primes', { 'tot_calls' : 2 }),
+    ('mobius_totient_primes', { 'use_prime_as_base' : False }),
+    ('mobius_totient_primes', { 'use_prime_as_base' : True }),
+    ('fibonacci', {}),
+    ('missing_primes_2013', {}),
+    ('gp_primes', {})
+]
+
+# Default maximum period of repeating keys derived from the key fragment itself
+DEFAULT_MAX_PERIOD = 20
+
+class KeySource(ABC):
+    """
+        A source of keys that can be looked up by a key fragment.
+        Keys are given as the values substracted from each rune, starting at the rune the fragment starts at.
+    """
+
+    @abstractmethod
+    def find(self, fragment, length):
+        """
+            Yields a description and a key of the given length for every key in the source that starts with the given fragment.
+        """
+        pass
+
+class PeriodicKeySource(KeySource):
+    """
+        Repeating keys derived from the fragment itself, for every period the fragment is consistent with.
+    """
+
+    def __init__(self, max_period=DEFAULT_MAX_PERIOD):
+        """
+            Creates an instance.
+        """
+
+        # Save the maximum period
+        self._max_period = max_period
+
+    def find(self, fragment, length):
+        """
+            Yields the repeated fragment for every period shorter than the fragment that repeats consistently within it.
+        """
+
+        # Periods as long as the fragment are always consistent and periods longer than it are unknown beyond it
+        for period in range(1, min(self._max_period, len(fragment) - 1) + 1):
+            if (fragment[period:] == fragment[:len(fragment) - period]).all():
+                yield f'Repeating key {"".join([ RUNES[i] for i in fragment[:period].tolist() ])}', np.resize(fragment[:period], length)
+
+class FragmentKeySource(KeySource):
+    """
+        Keys from every source of a fragment index that contains the fragment anywhere (see fragments.FragmentIndex).
+    """
+
+    def __init__(self, fragment_index):
+        """
+            Creates an instance.
+        """
+
+        # Save the index
+        self._fragment_index = fragment_index
+
+    def find(self, fragment, length):
+        """
+            Yields every source that contains the given fragment, rotated (if repeating) or cut to where the fragment occurs.
+        """
+
+        # Look up the fragment
+        for source_index, offset in self._fragment_index.find(fragment):
+            yield f'{self._fragment_index.get_name(source_index)} from {offset}', self._fragment_index.get_key(source_index, offset, length)
+
+def get_default_fragment_sources(lexicon):
+    """
+        Gets the names, sources and repeating flags of the default fragment index sources: words of the given lexicon (repeating)
+        and windows of the default keystreams, both substracted and added.
+    """
+
+    # Words repeat as keys
+    names = [ f'Word {"".join([ RUNES[i] for i in row ])}' for length in lexicon.get_lengths() for row in lexicon.get_rows(length).tolist() ]
+    sources = [ row for length in lexicon.get_lengths() for row in lexicon.get_rows(length) ]
+    repeating = [ True ] * len(sources)
+
+    # Keystreams run once, where substracting the negation is the same as adding the keystream
+    for name, params in DEFAULT_KEYSTREAMS:
+        values = np.array(get_keystream(name, DEFAULT_KEYSTREAM_WINDOW, **params), dtype=np.int64)
+        params_text = ''.join([ f', {k}={v}' for k, v in params.items() ])
+        names += [ f'Keystream {name}{params_text} (substracted)', f'Keystream {name}{params_text} (added)' ]
+        sources += [ values % len(RUNES), -values % len(RUNES) ]
+        repeating += [ False, False ]
+    return names, sources, repeating
+
+def get_default_key_sources(lexicon):
+    """
+        Gets all key sources: a fragment index over words of the given lexicon and the default keystreams, and periodic keys.
+    """
+
+    # Build all
+    return [ FragmentKeySource(FragmentIndex(*get_default_fragment_sources(lexicon))), PeriodicKeySource() ]
+
+def get_crib_plaintexts(processed_text, lexicon, phrase=None, word_count=1, first_rune=0, max_plaintexts=100000):
+    """
+        Gets the candidate plaintexts (as runes, without spaces) of the words starting at the given rune position.
+        Either a known phrase (in latin) or every combination of lexicon words matching the lengths of the given number of words.
+    """
+
+    # A known phrase is the only candidate
+    if phrase is not None:
+        return [ ''.join([ latin_to_runes(word) for word in phrase.split() ]) ]
+
+    # Combine lexicon words by the word lengths
+    lengths = [ end - start for start, end in processed_text.get_word_spans() if start >= first_rune ][:word_count]
+    words = [ lexicon.get_words_of_length(length) for length in lengths ]
+    return [ ''.join(option) for option in itertools.islice(itertools.product(*words), max_plaintexts) ]
+
+class CribEngine(object):
+    """
+        Finds keys from cribs: every candidate plaintext implies a key fragment, which is looked up in key sources.
+        Every key found is scored by the number of words it decrypts into the lexicon, starting at the crib.
+        Interrupters are not taken into account.
+    """
+
+    def __init__(self, lexicon, key_sources=None):
+        """
+            Creates an instance.
+        """
+
+        # Save the lexicon and the key sources
+        self._lexicon = lexicon
+        self._key_sources = key_sources if key_sources is not None else get_default_key_sources(lexicon)
+
+    def crib(self, processed_text, plaintexts, first_rune=0, min_words=1):
+        """
+            Tries all candidate plaintexts (as runes) at the given rune position of the processed text.
+            Returns tuples of the number of words decrypted, the plaintext, the key description and the key, ranked best first.
+        """
+
+        # Derive a key fragment from each plaintext
+        scorer = WordPrefixScorer(processed_text, self._lexicon)
+        ciphertext = processed_text.get_indices().astype(np.int64)
+        length = len(ciphertext) - first_rune
+        results = []
+        for plaintext in plaintexts:
+            if len(plaintext) == 0 or len(plaintext) > length:
+                continue
+            fragment = (ciphertext[first_rune:first_rune + len(plaintext)] - np.array([ RUNE_INDICES[rune] for rune in plaintext ], dtype=np.int64)) % len(RUNES)
+
+            # Look up the fragment in all sources and score every key found
+            for key_source in self._key_sources:
+                for description, key in key_source.find(fragment, length):
+                    word_count = scorer.score_keystream(key, first_rune)
+                    if word_count >= min_words:
+                        results.append((word_count, plaintext, description, key))
+
+        # Rank
+        results.sort(key=lambda result: -result[0])
+        return results
+
+    @staticmethod
+    def decrypt(processed_text, key, first_rune=0):
+        """
+            Decrypts the processed text with a key found from a crib, keeping runes before the crib (and beyond the key) as they are.
+        """
+
+        # Substract the key
+        pt = ProcessedText.from_processed_text(processed_text)
+        indices = pt.get_indices().astype(np.int64)
+        indices[first_rune:first_rune + len(key)] = (indices[first_rune:first_rune + len(key)] - key) % len(RUNES)
+        pt.set_indices(indices)
+        return pt
@@ -0,0 +1,348 @@
+from core import ProcessedText
+from lexicon import RuneLexicon
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
+import itertools
+import hashlib
+import bisect
+import pickle
+import queue
+import time
+import uuid
+import os
+from tqdm import tqdm
+
+# Number of tasks sent to a worker at once
+DEFAULT_CHUNK_SIZE = 64
+
+# Number of chunks kept in flight per worker
+_CHUNKS_PER_WORKER = 4
+
+# Default number of seconds between checkpoints of a sweep
+DEFAULT_CHECKPOINT_INTERVAL = 60
+
+# Checkpoint file format version
+_CHECKPOINT_VERSION = 1
+
+def _create_shared_memory(data):
+    """
+        Copies the given bytes to a new shared memory block.
+    """
+
+    # Name the block explicitly since the default naming relies on the standard "secrets" module, which is shadowed by our own
+    shm = shared_memory.SharedMemory(name=f'cicada_{os.getpid()}_{uuid.uuid4().hex[:12]}', create=True, size=max(len(data), 1))
+    shm.buf[:len(data)] = data
+    return shm
+
+class SweepCheckpoint(object):
+    """
+        The progress of a sweep: the ordinals of the tasks that are done (as sorted, merged ranges) and the hits they found.
+        Saved to a file so an interrupted sweep resumes where it stopped, as long as it enumerates the same tasks in the same order.
+    """
+
+    def __init__(self, path, sweep_id):
+        """
+            Creates an empty checkpoint for the sweep with the given identifier.
+        """
+
+        # Nothing is done yet
+        self._path = path
+        self._sweep_id = sweep_id
+        self._starts = []
+        self._ends = []
+        self._hits = []
+        self._done_count = 0
+
+    @staticmethod
+    def load(path, sweep_id):
+        """
+            Loads the checkpoint of the sweep with the given identifier, or creates an empty one if there is none (or it belongs to another sweep).
+        """
+
+        # Start over unless the file matches
+        checkpoint = SweepCheckpoint(path, sweep_id)
+        if not os.path.isfile(path):
+            return checkpoint
+        with open(path, 'rb') as fp:
+            saved = pickle.load(fp)
+        if saved.get('version') != _CHECKPOINT_VERSION or saved.get('sweep_id') != sweep_id:
+            return checkpoint
+
+        # Restore progress
+        checkpoint._starts = [ start for start, end in saved['ranges'] ]
+        checkpoint._ends = [ end for start, end in saved['ranges'] ]
+        checkpoint._hits = saved['hits']
+        checkpoint._done_count = sum([ end - start for start, end in saved['ranges'] ])
+        return checkpoint
+
+    def is_done(self, ordinal):
+        """
+            Indicates whether the task with the given ordinal is done.
+        """
+
+        # Find the last range that starts at or before the ordinal
+        range_index = bisect.bisect_right(self._starts, ordinal) - 1
+        return range_index >= 0 and ordinal < self._ends[range_index]
+
+    def get_done_count(self):
+        """
+            Gets the number of tasks that are done.
+        """
+
+        # Counted as ranges are added
+        return self._done_count
+
+    def get_hits(self):
+        """
+            Gets all hits of the tasks that are done.
+        """
+
+        # Return as is
+        return self._hits
+
+    def add(self, ordinals, hits):
+        """
+            Marks the tasks with the given ordinals as done, along with their hits.
+        """
+
+        # Insert each ordinal as a range and merge it with its neighbours
+        for ordinal in ordinals:
+            if self.is_done(ordinal):
+                continue
+            range_index = bisect.bisect_right(self._starts, ordinal)
+            self._starts.insert(range_index, ordinal)
+            self._ends.insert(range_index, ordinal + 1)
+            if range_index > 0 and self._ends[range_index - 1] == ordinal:
+                self._ends[range_index - 1] = self._ends.pop(range_index)
+                self._starts.pop(range_index)
+                range_index -= 1
+            if range_index + 1 < len(self._starts) and self._starts[range_index + 1] == self._ends[range_index]:
+                self._ends[range_index] = self._ends.pop(range_index + 1)
+                self._starts.pop(range_index + 1)
+            self._done_count += 1
+        self._hits += hits
+
+    def save(self):
+        """
+            Saves the checkpoint, replacing the file atomically so an interruption never leaves a partial file.
+        """
+
+        # Write to a temporary file and move it over the old one
+        saved = { 'version' : _CHECKPOINT_VERSION, 'sweep_id' : self._sweep_id, 'ranges' : list(zip(self._starts, self._ends)), 'hits' : self._hits }
+        with open(self._path + '.tmp', 'wb') as fp:
+            pickle.dump(saved, fp)
+        os.replace(self._path + '.tmp', self._path)
+
+    def remove(self):
+        """
+            Removes the checkpoint file, once the sweep is finished.
+        """
+
+        # Remove if saved
+        if os.path.isfile(self._path):
+            os.remove(self._path)
+
+class SweepContext(object):
+    """
+        Everything a worker needs to evaluate tasks: the pages, the lexicon and any extra data of the sweep.
+    """
+
+    def __init__(self, pages, lexicon, data):
+        """
+            Creates an instance.
+        """
+
+        # Save everything
+        self.pages = pages
+        self.lexicon = lexicon
+        self.data = data
+
+    def get_page(self, page_index):
+        """
+            Gets a fresh copy of a page as a processed text.
+        """
+
+        # Clone the parsed page
+        return ProcessedText.from_processed_text(self.pages[page_index])
+
+# Worker state, set once per worker process
+_worker_context = None
+_worker_evaluate = None
+_worker_queue = None
+_worker_shms = []
+
+def _init_worker(pages_shm_name, page_offsets, lexicon_shm_name, data, evaluate, results_queue):
+    """
+        Initializes a worker process from the shared memory blocks.
+    """
+
+    # Decode the pages and map the lexicon, keeping the lexicon attached for the lifetime of the worker (the process that created the blocks unlinks them)
+    global _worker_context, _worker_evaluate, _worker_queue
+    pages_shm = shared_memory.SharedMemory(name=pages_shm_name)
+    pages_blob = bytes(pages_shm.buf[:page_offsets[-1]])
+    pages = [ ProcessedText(pages_blob[page_offsets[i]:page_offsets[i + 1]].decode('utf-8')) for i in range(len(page_offsets) - 1) ]
+    lexicon = None
+    if lexicon_shm_name is not None:
+        lexicon_shm = shared_memory.SharedMemory(name=lexicon_shm_name)
+        _worker_shms.append(lexicon_shm)
+        lexicon = RuneLexicon.from_buffer(lexicon_shm.buf)
+    pages_shm.close()
+
+    # Save state
+    _worker_context = SweepContext(pages, lexicon, data)
+    _worker_evaluate = evaluate
+    _worker_queue = results_queue
+
+def _run_chunk(chunk_id, tasks):
+    """
+        Evaluates a chunk of tasks in a worker, streaming hits and progress back through the queue.
+    """
+
+    # Evaluate each task and report hits as soon as they are found
+    for task in tasks:
+        for hit in _worker_evaluate(_worker_context, task) or []:
+            _worker_queue.put(('hit', chunk_id, hit))
+        _worker_queue.put(('progress', chunk_id, 1))
+
+    # Indicate the chunk is done
+    _worker_queue.put(('done', chunk_id, len(tasks)))
+
+def _check_futures(futures):
+    """
+        Raises the exception of any failed chunk (which never reports itself as done) and returns the chunks still running.
+    """
+
+    # Surface failures
+    for future in futures:
+        if future.done():
+            future.result()
+    return [ future for future in futures if not future.done() ]
+
+def get_sweep_id(evaluate, tasks, total, pages, lexicon_bytes, data):
+    """
+        Gets an identifier of a sweep from its evaluate function, tasks, pages, serialized lexicon and data, so checkpoints of other sweeps are never resumed.
+        Task sequences (e.g. lists) are hashed entirely, while task iterators are only identified by their total, so they must be derived from the pages and data.
+    """
+
+    # Hash everything that affects the results, including the tasks as checkpoints refer to them by ordinal
+    result = hashlib.sha256()
+    result.update(f'{evaluate.__module__}.{evaluate.__qualname__}'.encode('utf-8'))
+    result.update(hashlib.sha256(pickle.dumps(list(tasks) if hasattr(tasks, '__len__') else None)).digest())
+    result.update(pickle.dumps(total))
+    for page in pages:
+        result.update(hashlib.sha256(page.encode('utf-8')).digest())
+    result.update(hashlib.sha256(lexicon_bytes or b'').digest())
+    result.update(pickle.dumps(data))
+    return result.hexdigest()
+
+def run_parallel_sweep(evaluate, tasks, pages, lexicon=None, data=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, total=None, desc='Sweep', checkpoint_path=None, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+    """
+        Evaluates all tasks of a search space across worker processes, yielding hits as they arrive.
+        The evaluate function is called as evaluate(context, task) with a SweepContext, and returns an iterable of hits (or None).
+        It must be a module-level function so it can be sent to workers; pages (runic texts), lexicon and data are sent to each worker once.
+        If a checkpoint path is given, the tasks that are done and their hits are saved to it every given number of seconds (and when interrupted),
+        and a sweep that finds a checkpoint of itself yields the saved hits first and skips the tasks that are done. The checkpoint is removed once the sweep finishes.
+        Checkpointed sweeps should give tasks as a list, or as an iterator that only depends on the pages, data and total (see get_sweep_id).
+    """
+
+    # Resume from the checkpoint, if there is one
+    lexicon_bytes = lexicon.to_bytes() if lexicon is not None else None
+    if total is None and hasattr(tasks, '__len__'):
+        total = len(tasks)
+    checkpoint = None
+    if checkpoint_path is not None:
+        checkpoint = SweepCheckpoint.load(checkpoint_path, get_sweep_id(evaluate, tasks, total, pages, lexicon_bytes, data))
+
+    # Share pages and the lexicon
+    encoded_pages = [ page.encode('utf-8') for page in pages ]
+    page_offsets = [ 0 ] + list(itertools.accumulate([ len(page) for page in encoded_pages ]))
+    pages_shm = _create_shared_memory(b''.join(encoded_pages))
+    lexicon_shm = _create_shared_memory(lexicon_bytes) if lexicon is not None else None
+
+    # Progress is tracked by tasks
+    workers = workers or os.cpu_count()
+    progress = tqdm(total=total, desc=desc, initial=checkpoint.get_done_count() if checkpoint is not None else 0)
+    finished = False
+    try:
+
+        # Hits of tasks that were done before are yielded first
+        if checkpoint is not None:
+            yield from checkpoint.get_hits()
+        results_queue = multiprocessing.get_context().Queue()
+        initargs = (pages_shm.name, page_offsets, lexicon_shm.name if lexicon_shm is not None else None, data, evaluate, results_queue)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+
+            # Number tasks so chunks can be checkpointed, skipping tasks that are already done
+            numbered_tasks = (( ordinal, task ) for ordinal, task in enumerate(tasks) if checkpoint is None or not checkpoint.is_done(ordinal))
+            chunks = enumerate(iter(lambda: list(itertools.islice(numbered_tasks, chunk_size)), []))
+            chunk_ordinals = {}
+            chunk_hits = {}
+            futures = []
+
+            # Keep a bounded number of chunks in flight
+            for chunk_id, chunk in itertools.islice(chunks, workers * _CHUNKS_PER_WORKER):
+                chunk_ordinals[chunk_id] = [ ordinal for ordinal, task in chunk ]
+                chunk_hits[chunk_id] = []
+                futures.append(pool.submit(_run_chunk, chunk_id, [ task for ordinal, task in chunk ]))
+            last_checkpoint = time.monotonic()
+
+            # Stream messages until all chunks are done
+            try:
+                while len(chunk_ordinals) > 0:
+                    try:
+                        kind, chunk_id, value = results_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        futures = _check_futures(futures)
+                        continue
+                    if kind == 'hit':
+                        chunk_hits[chunk_id].append(value)
+                        yield value
+                    elif kind == 'progress':
+                        progress.update(value)
+                    elif kind == 'done':
+                        ordinals = chunk_ordinals.pop(chunk_id)
+                        hits = chunk_hits.pop(chunk_id)
+                        futures = _check_futures(futures)
+                        for chunk_id, chunk in itertools.islice(chunks, 1):
+                            chunk_ordinals[chunk_id] = [ ordinal for ordinal, task in chunk ]
+                            chunk_hits[chunk_id] = []
+                            futures.append(pool.submit(_run_chunk, chunk_id, [ task for ordinal, task in chunk ]))
+
+                        # Checkpoint every once in a while
+                        if checkpoint is not None:
+                            checkpoint.add(ordinals, hits)
+                            if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                                checkpoint.save()
+                                last_checkpoint = time.monotonic()
+                finished = True
+            finally:
+
+                # When stopped early, cancel chunks that did not start and drain the queue until running chunks end, so no worker blocks on a full queue
+                if not finished:
+                    for future in futures:
+                        future.cancel()
+                    while not all([ future.done() for future in futures ]):
+                        try:
+                            kind, chunk_id, value = results_queue.get(timeout=0.1)
+                        except queue.Empty:
+                            continue
+                        if kind == 'hit':
+                            chunk_hits[chunk_id].append(value)
+                        elif kind == 'done' and checkpoint is not None:
+                            checkpoint.add(chunk_ordinals.pop(chunk_id), chunk_hits.pop(chunk_id))
+    finally:
+
+        # Keep the progress of unfinished sweeps and forget finished ones
+        if checkpoint is not None:
+            if finished:
+                checkpoint.remove()
+            else:
+                checkpoint.save()
+
+        # Clean up
+        progress.close()
+        for shm in (pages_shm, lexicon_shm):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
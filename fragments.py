@@ -0,0 +1,238 @@
+from core import RUNES
+import numpy as np
+import struct
+import mmap
+import os
+
+# Number of runes in each indexed k-mer and the number of possible k-mers
+KMER_SIZE = 3
+KMER_COUNT = len(RUNES) ** KMER_SIZE
+
+# Corpus value that separates sources, so no match crosses from one source to the next
+_SEPARATOR = 0xFF
+
+# Compiled index file format: header (magic, version, source hash, source count, corpus length, position count, tail count, names length)
+# followed by the source starts, k-mer offsets, positions, tail positions, repeating flags, corpus and names, aligned to 8 bytes
+_FILE_MAGIC = b'RFIX'
+_FILE_VERSION = 2
+_FILE_HEADER = struct.Struct('<4sI32sQQQQQ')
+
+class FragmentIndex(object):
+    """
+        A reverse index of key fragments over many named sources (words, page texts, keystream windows), each given as Gematria indices.
+        All sources are concatenated to a single corpus, and every position is indexed by the k-mer that starts there,
+        so finding every occurrence of a fragment is a bucket lookup followed by a vectorized comparison.
+        Repeating sources wrap around, so a fragment also matches across the end of a repeating source or repeats it more than once.
+    """
+
+    def __init__(self, names, sources, repeating):
+        """
+            Creates an instance from source names, sources (as arrays of indices) and whether each source repeats (e.g. a word used as a key).
+        """
+
+        # Concatenate sources, each followed by a separator
+        assert len(names) == len(sources) == len(repeating), Exception('Every source must have a name and a repeating flag')
+        repeating = np.asarray(repeating, dtype=bool)
+        lengths = np.array([ len(source) for source in sources ], dtype=np.int64)
+        source_starts = np.concatenate([ np.zeros(1, dtype=np.int64), np.cumsum(lengths + 1) ])
+        corpus = np.full(int(source_starts[-1]), _SEPARATOR, dtype=np.uint8)
+        for source_index, source in enumerate(sources):
+            corpus[source_starts[source_index]:source_starts[source_index] + lengths[source_index]] = np.asarray(source, dtype=np.int64) % len(RUNES)
+        corpus.flags.writeable = False
+
+        # Encode the k-mer at every position, where repeating sources wrap around and positions too close to the end of other sources are kept aside
+        windows = self._get_windows(corpus, source_starts, lengths, repeating, np.arange(len(corpus)), KMER_SIZE)
+        complete = (windows != _SEPARATOR).all(axis=1)
+        positions = np.flatnonzero(complete)
+        codes = np.zeros(len(positions), dtype=np.int64)
+        for offset in range(KMER_SIZE):
+            codes = codes * len(RUNES) + windows[positions, offset]
+
+        # Bucket positions by k-mer
+        order = np.argsort(codes, kind='stable')
+        kmer_offsets = np.searchsorted(codes[order], np.arange(KMER_COUNT + 1)).astype(np.int64)
+        tail_positions = np.flatnonzero(~complete & (corpus != _SEPARATOR))
+        self._init_arrays(source_starts, kmer_offsets, positions[order].astype(np.uint32), tail_positions.astype(np.uint32), repeating, corpus)
+        self._names = list(names)
+        self._names_buffer = None
+
+    @staticmethod
+    def _get_windows(corpus, source_starts, lengths, repeating, positions, size):
+        """
+            Gets the corpus values of the given size starting at each of the given positions, wrapping around repeating sources.
+            Windows of other sources run into the separator at their end.
+        """
+
+        # Offset every window within its source, wrapping offsets of repeating sources (but not of separators)
+        source_indices = np.searchsorted(source_starts, positions, 'right') - 1
+        starts = source_starts[source_indices]
+        offsets = positions - starts
+        window_offsets = offsets[:, None] + np.arange(size)[None, :]
+        wraps = repeating[source_indices] & (offsets < lengths[source_indices])
+        window_offsets[wraps] %= lengths[source_indices][wraps][:, None]
+        return np.take(corpus, starts[:, None] + window_offsets, mode='clip')
+
+    def _init_arrays(self, source_starts, kmer_offsets, positions, tail_positions, repeating, corpus):
+        """
+            Initializes the instance from its arrays.
+        """
+
+        # Save all
+        self._source_starts = source_starts
+        self._kmer_offsets = kmer_offsets
+        self._positions = positions
+        self._tail_positions = tail_positions
+        self._repeating = repeating
+        self._corpus = corpus
+
+    def __len__(self):
+        """
+            Gets the number of sources.
+        """
+
+        # Count sources
+        return len(self._repeating)
+
+    def _get_names(self):
+        """
+            Gets the names of all sources.
+        """
+
+        # Names of loaded indices are decoded on first use
+        if self._names is None:
+            self._names = bytes(self._names_buffer).decode('utf-8').split('\n')
+        return self._names
+
+    def get_name(self, source_index):
+        """
+            Gets the name of the given source.
+        """
+
+        # Take from all names
+        return self._get_names()[source_index]
+
+    def get_source(self, source_index):
+        """
+            Gets the given source as a read-only array of indices.
+        """
+
+        # Take a view of the corpus
+        return self._corpus[self._source_starts[source_index]:self._source_starts[source_index + 1] - 1]
+
+    def is_repeating(self, source_index):
+        """
+            Indicates whether the given source repeats.
+        """
+
+        # Check the flag
+        return bool(self._repeating[source_index])
+
+    def find(self, fragment):
+        """
+            Finds every occurrence of the given fragment (as indices) in all sources.
+            Returns a list of tuples of source index and offset within the source.
+        """
+
+        # Fragments at least as long as a k-mer are looked up in the bucket of their first k-mer
+        fragment = np.asarray(fragment, dtype=np.int64)
+        assert len(fragment) > 0, Exception('Fragment must not be empty')
+        prefix_length = min(len(fragment), KMER_SIZE)
+        code = 0
+        for index in fragment[:prefix_length].tolist():
+            code = code * len(RUNES) + index
+        code *= len(RUNES) ** (KMER_SIZE - prefix_length)
+        end_code = code + len(RUNES) ** (KMER_SIZE - prefix_length)
+        candidates = self._positions[self._kmer_offsets[code]:self._kmer_offsets[end_code]].astype(np.int64)
+
+        # Shorter fragments take every k-mer they prefix and might also occur too close to the end of a non-repeating source to have a k-mer
+        if len(fragment) < KMER_SIZE:
+            candidates = np.concatenate([ candidates, self._tail_positions.astype(np.int64) ])
+
+        # Compare the entire fragment, where repeating sources wrap around and separators never match
+        windows = self._get_windows(self._corpus, self._source_starts, np.diff(self._source_starts) - 1, self._repeating, candidates, len(fragment))
+        matches = np.sort(candidates[(windows == fragment[None, :]).all(axis=1)])
+        source_indices = np.searchsorted(self._source_starts, matches, 'right') - 1
+        return list(zip(source_indices.tolist(), (matches - self._source_starts[source_indices]).tolist()))
+
+    def get_key(self, source_index, offset, length):
+        """
+            Gets up to the given number of key values of the given source, starting at the given offset.
+            Repeating sources are rotated to the offset and repeated, and other sources end where they end.
+        """
+
+        # Either repeat or take a window
+        source = self.get_source(source_index).astype(np.int64)
+        if self.is_repeating(source_index):
+            return np.resize(np.roll(source, -offset), length)
+        return source[offset:offset + length]
+
+    def to_bytes(self, source_hash=b'\x00' * 32):
+        """
+            Serializes the index, along with a hash of the sources it was built from.
+        """
+
+        # Lay out all arrays after the header, aligned to 8 bytes
+        names = '\n'.join(self._get_names()).encode('utf-8')
+        result = bytearray(_FILE_HEADER.size)
+        _FILE_HEADER.pack_into(result, 0, _FILE_MAGIC, _FILE_VERSION, source_hash, len(self), len(self._corpus), len(self._positions), len(self._tail_positions), len(names))
+        for data in (self._source_starts.astype('<i8'), self._kmer_offsets.astype('<i8'), self._positions.astype('<u4'), self._tail_positions.astype('<u4'), self._repeating.astype(np.uint8), self._corpus):
+            result += b'\x00' * (-len(result) % 8)
+            result += data.tobytes()
+        result += b'\x00' * (-len(result) % 8)
+        return bytes(result + names)
+
+    @staticmethod
+    def from_buffer(buffer, source_hash=None):
+        """
+            Deserializes an index from a buffer without copying it (e.g. a memory-mapped file or shared memory).
+            Returns None if the buffer is invalid or was built from sources with a different hash.
+        """
+
+        # Validate the header
+        if len(buffer) < _FILE_HEADER.size:
+            return None
+        magic, version, buffer_hash, source_count, corpus_length, position_count, tail_count, names_length = _FILE_HEADER.unpack_from(buffer, 0)
+        if magic != _FILE_MAGIC or version != _FILE_VERSION or (source_hash is not None and buffer_hash != source_hash):
+            return None
+
+        # Take arrays as views of the buffer
+        arrays = []
+        offset = _FILE_HEADER.size
+        for dtype, count in (('<i8', source_count + 1), ('<i8', KMER_COUNT + 1), ('<u4', position_count), ('<u4', tail_count), (np.uint8, source_count), (np.uint8, corpus_length)):
+            offset += -offset % 8
+            arrays.append(np.frombuffer(buffer, dtype=dtype, count=count, offset=offset))
+            offset += arrays[-1].nbytes
+        offset += -offset % 8
+        if len(buffer) != offset + names_length:
+            return None
+
+        # Build the instance without going through sources
+        index = FragmentIndex.__new__(FragmentIndex)
+        source_starts, kmer_offsets, positions, tail_positions, repeating, corpus = arrays
+        index._init_arrays(source_starts.astype(np.int64, copy=False), kmer_offsets.astype(np.int64, copy=False), positions, tail_positions, repeating.view(bool), corpus)
+        index._names = None
+        index._names_buffer = memoryview(buffer)[offset:offset + names_length]
+        return index
+
+    def save(self, path, source_hash):
+        """
+            Saves the index to a binary file, along with a hash of the sources it was built from.
+        """
+
+        # Write everything
+        with open(path, 'wb') as fp:
+            fp.write(self.to_bytes(source_hash))
+
+    @staticmethod
+    def load(path, source_hash=None):
+        """
+            Loads an index from a binary file by memory-mapping it.
+            Returns None if the file does not exist, is invalid or was built from sources with a different hash.
+        """
+
+        # Map the file
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return FragmentIndex.from_buffer(mapped, source_hash)
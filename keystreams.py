@@ -0,0 +1,186 @@
+from core import RUNES
+from core import GP_PRIMES
+from numtheory import get_tables
+from collections import OrderedDict
+import itertools
+import numpy as np
+import sympy
+import secrets
+
+# Maximum number of materialized keystreams kept in the cache
+MAX_CACHED_KEYSTREAMS = 64
+
+# Registered keystream generators by name
+KEYSTREAM_GENERATORS = {}
+
+def register_keystream(name):
+    """
+        Decorator that registers a keystream generator under the given name.
+        Generators are Python generators that yield either single values or arrays of consecutive values, and may take parameters.
+        Values must fit in 64 bits, so generators of fast growing sequences should yield their values mod 29.
+    """
+
+    # Register
+    def register(generator):
+        KEYSTREAM_GENERATORS[name] = generator
+        return generator
+    return register
+
+def _yield_table_blocks(get_block):
+    """
+        Yields blocks of a table-based keystream, doubling the block size each time.
+    """
+
+    # Blocks are given as start and end positions
+    start, end = 0, 1024
+    while True:
+        yield get_block(start, end)
+        start, end = end, end * 2
+
+@register_keystream('primes')
+def _primes():
+    """
+        All primes.
+    """
+
+    # Take primes from the tables
+    yield from _yield_table_blocks(lambda start, end: get_tables().get_primes(end)[start:])
+
+@register_keystream('totient_primes')
+def _totient_primes(tot_calls=1):
+    """
+        The totient function of all primes, called the given number of times.
+    """
+
+    # Apply the totient function on primes from the tables
+    yield from _yield_table_blocks(lambda start, end: get_tables().get_totients(get_tables().get_primes(end)[start:], tot_calls))
+
+@register_keystream('mobius_totient_primes')
+def _mobius_totient_primes(use_prime_as_base=False):
+    """
+        The Mobius function of the totient of all primes, times either the totient or the prime.
+    """
+
+    # Work on blocks of primes from the tables
+    def get_block(start, end):
+        primes = get_tables().get_primes(end)[start:]
+        tots = get_tables().get_totients(primes)
+        return get_tables().get_mobius(tots) * (primes if use_prime_as_base else tots)
+    yield from _yield_table_blocks(get_block)
+
+@register_keystream('fibonacci')
+def _fibonacci():
+    """
+        The Fibonacci sequence, starting with 1, 1.
+    """
+
+    # Values grow too fast for tables so just iterate
+    fib_a, fib_b = 1, 1
+    while True:
+        yield fib_a % len(RUNES)
+        fib_a, fib_b = fib_b, fib_a + fib_b
+
+@register_keystream('totient_fibonacci')
+def _totient_fibonacci(tot_calls=1):
+    """
+        The totient function of the Fibonacci sequence, called the given number of times.
+    """
+
+    # Values grow too fast for tables so factorize each one
+    fib_a, fib_b = 1, 1
+    while True:
+        val = fib_a
+        for i in range(tot_calls):
+            val = int(sympy.totient(val))
+        yield val % len(RUNES)
+        fib_a, fib_b = fib_b, fib_a + fib_b
+
+@register_keystream('missing_primes_2013')
+def _missing_primes_2013():
+    """
+        The primes missing from the 2013 message (finite).
+    """
+
+    # Just yield them all
+    yield np.array(secrets.MISSING_PRIMES_2013, dtype=np.int64)
+
+@register_keystream('gp_primes')
+def _gp_primes():
+    """
+        The Gematria primes, repeating.
+    """
+
+    # Repeat forever
+    yield from itertools.repeat(np.array(GP_PRIMES, dtype=np.int64))
+
+class _MaterializedKeystream(object):
+    """
+        A keystream materialized as mod 29 values, extended on demand.
+    """
+
+    def __init__(self, generator):
+        """
+            Creates an instance.
+        """
+
+        # Nothing materialized yet
+        self._generator = generator
+        self._blocks = []
+        self._values = np.zeros(0, dtype=np.int64)
+        self._values.flags.writeable = False
+        self._length = 0
+        self._exhausted = False
+
+    def get(self, length):
+        """
+            Gets the first values, which might be less than requested for finite keystreams.
+        """
+
+        # Extend as needed
+        if self._length < length and not self._exhausted:
+            for block in self._generator:
+                block = np.atleast_1d(np.asarray(block, dtype=np.int64)) % len(RUNES)
+                self._blocks.append(block)
+                self._length += len(block)
+                if self._length >= length:
+                    break
+            else:
+                self._exhausted = True
+
+            # Concatenate everything materialized so far
+            self._values = np.concatenate([ self._values ] + self._blocks)
+            self._values.flags.writeable = False
+            self._blocks = []
+
+        # Return a read-only view
+        return self._values[:length]
+
+# Materialized keystreams, in least recently used order
+_CACHE = OrderedDict()
+
+def get_keystream(name, length, **params):
+    """
+        Gets the first mod 29 values of the registered keystream with the given name and parameters.
+        The result is read-only and shared, and might be shorter than requested for finite keystreams.
+    """
+
+    # Get from the cache or create a new materialized keystream
+    key = (name, tuple(sorted(params.items())))
+    if key in _CACHE:
+        _CACHE.move_to_end(key)
+    else:
+        assert name in KEYSTREAM_GENERATORS, Exception(f'Unknown keystream: {name}')
+        _CACHE[key] = _MaterializedKeystream(KEYSTREAM_GENERATORS[name](**params))
+        while len(_CACHE) > MAX_CACHED_KEYSTREAMS:
+            _CACHE.popitem(last=False)
+
+    # Materialize as much as needed
+    return _CACHE[key].get(length)
+
+def clear_keystream_cache():
+    """
+        Clears all materialized keystreams.
+    """
+
+    # Clear
+    _CACHE.clear()
@@ -0,0 +1,291 @@
+from core import RUNES
+from core import RUNE_INDICES
+import numpy as np
+import hashlib
+import struct
+import mmap
+import os
+
+# Longest word length that still fits as a base-29 code in 64 bits
+MAX_CODE_WORD_LENGTH = 13
+
+# Trie key that marks the end of a word
+_END_OF_WORD = -1
+
+# Compiled lexicon file format: header (magic, version, source hash, bucket count) followed by bucket entries (length, count, rows offset, codes offset)
+_FILE_MAGIC = b'RLEX'
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sI32sI')
+_FILE_BUCKET = struct.Struct('<IIQQ')
+
+def encode_words(words):
+    """
+        Encodes a matrix of words of the same length (one word per row, as indices) to base-29 codes.
+    """
+
+    # Use 64-bit arithmetic, which is exact up to the maximum code word length
+    assert words.shape[1] <= MAX_CODE_WORD_LENGTH, Exception(f'Words longer than {MAX_CODE_WORD_LENGTH} runes cannot be encoded')
+    powers = len(RUNES) ** np.arange(words.shape[1] - 1, -1, -1, dtype=np.uint64)
+    return (words.astype(np.uint64) * powers).sum(axis=1, dtype=np.uint64)
+
+def encode_word(indices):
+    """
+        Encodes a single word (as indices) to its base-29 code, of any length.
+    """
+
+    # Python integers never overflow
+    code = 0
+    for index in indices:
+        code = code * len(RUNES) + index
+    return code
+
+def hash_files(paths):
+    """
+        Gets a hash of the contents of the given files.
+    """
+
+    # Hash all files in order
+    result = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as fp:
+            result.update(fp.read())
+    return result.digest()
+
+class RuneLexicon(object):
+    """
+        An index of Runic words, supporting membership tests on runes or indices, prefix tests and batched lookups.
+        Words are kept as length buckets of Gematria indices, sorted by their base-29 codes.
+    """
+
+    def __init__(self, words):
+        """
+            Creates an instance from Runic words.
+        """
+
+        # Bucket words by length as indices
+        words_by_length = {}
+        for word in set(words):
+            if len(word) > 0:
+                words_by_length.setdefault(len(word), []).append([ RUNE_INDICES[rune] for rune in word ])
+        self._init_buckets({ length: np.array(rows, dtype=np.uint8) for length, rows in words_by_length.items() })
+
+    def _init_buckets(self, buckets, codes_by_length=None):
+        """
+            Initializes from length buckets of indices, sorting them by their codes unless the codes are given.
+        """
+
+        # Sort encodable buckets by their codes
+        self._buckets = {}
+        self._codes_by_length = {}
+        for length, rows in buckets.items():
+            if codes_by_length is not None:
+                self._buckets[length] = rows
+                if length in codes_by_length:
+                    self._codes_by_length[length] = codes_by_length[length]
+            elif length <= MAX_CODE_WORD_LENGTH:
+                codes = encode_words(rows)
+                order = np.argsort(codes)
+                self._buckets[length] = rows[order]
+                self._codes_by_length[length] = codes[order]
+            else:
+                self._buckets[length] = rows
+
+        # Everything else is built lazily
+        self._code_sets = {}
+        self._trie = None
+
+    def __contains__(self, word):
+        """
+            Indicates whether the word (either runes or indices) is in the lexicon.
+        """
+
+        # Runes are translated to indices first
+        if isinstance(word, str):
+            if not all([ rune in RUNE_INDICES for rune in word ]):
+                return False
+            word = [ RUNE_INDICES[rune] for rune in word ]
+        return self.contains_indices(word)
+
+    def __len__(self):
+        """
+            Gets the number of words.
+        """
+
+        # Count words
+        return sum([ len(rows) for rows in self._buckets.values() ])
+
+    def __iter__(self):
+        """
+            Iterates all words (as runes), longest first.
+        """
+
+        # Iterate by length
+        for length in self.get_lengths()[::-1]:
+            yield from self.get_words_of_length(length)
+
+    def get_lengths(self):
+        """
+            Gets all word lengths.
+        """
+
+        # Sorted lengths
+        return sorted(self._buckets.keys())
+
+    def get_rows(self, length):
+        """
+            Gets all words of the given length as a read-only matrix of indices.
+        """
+
+        # Either the bucket or an empty matrix
+        return self._buckets.get(length, np.zeros((0, length), dtype=np.uint8))
+
+    def get_words_of_length(self, length):
+        """
+            Gets all words of the given length (as runes).
+        """
+
+        # Translate rows
+        return [ ''.join([ RUNES[i] for i in row ]) for row in self.get_rows(length).tolist() ]
+
+    def _get_code_set(self, length):
+        """
+            Gets a set of the codes of all words of the given length.
+        """
+
+        # Build lazily
+        if length not in self._code_sets:
+            if length in self._codes_by_length:
+                self._code_sets[length] = frozenset(self._codes_by_length[length].tolist())
+            else:
+                self._code_sets[length] = frozenset([ encode_word(row) for row in self.get_rows(length).tolist() ])
+        return self._code_sets[length]
+
+    def contains_indices(self, indices):
+        """
+            Indicates whether the word given as indices is in the lexicon.
+        """
+
+        # Hash lookup of the code within the length bucket
+        indices = np.asarray(indices).tolist()
+        if len(indices) not in self._buckets:
+            return False
+        return encode_word(indices) in self._get_code_set(len(indices))
+
+    def _get_trie(self):
+        """
+            Gets the trie of all words, keyed by Gematria indices.
+        """
+
+        # Build lazily
+        if self._trie is None:
+            self._trie = {}
+            for rows in self._buckets.values():
+                for row in rows.tolist():
+                    node = self._trie
+                    for index in row:
+                        node = node.setdefault(index, {})
+                    node[_END_OF_WORD] = True
+        return self._trie
+
+    def has_prefix(self, indices):
+        """
+            Indicates whether any word in the lexicon starts with the given indices.
+        """
+
+        # Walk the trie until there is no node
+        node = self._get_trie()
+        for index in np.asarray(indices).tolist():
+            node = node.get(index)
+            if node is None:
+                return False
+        return True
+
+    def contains_rows(self, words):
+        """
+            Indicates for each row of the given matrix of same-length words (as indices) whether it is in the lexicon.
+        """
+
+        # Handle unknown lengths
+        length = words.shape[1]
+        if length not in self._buckets:
+            return np.zeros(len(words), dtype=bool)
+
+        # Either look up sorted codes or fall back to hashing each long word
+        if length in self._codes_by_length:
+            codes = self._codes_by_length[length]
+            encoded = encode_words(words)
+            return codes[np.minimum(np.searchsorted(codes, encoded), len(codes) - 1)] == encoded
+        code_set = self._get_code_set(length)
+        return np.array([ encode_word(row) in code_set for row in words.tolist() ], dtype=bool)
+
+    def to_bytes(self, source_hash=b'\x00' * 32):
+        """
+            Serializes the lexicon, along with a hash of the sources it was built from.
+        """
+
+        # Lay out all buckets after the header, aligned to 8 bytes
+        lengths = self.get_lengths()
+        result = bytearray(_FILE_HEADER.size + _FILE_BUCKET.size * len(lengths))
+        _FILE_HEADER.pack_into(result, 0, _FILE_MAGIC, _FILE_VERSION, source_hash, len(lengths))
+        for i, length in enumerate(lengths):
+            result += b'\x00' * (-len(result) % 8)
+            rows_offset = len(result)
+            result += self._buckets[length].tobytes()
+            codes_offset = 0
+            if length in self._codes_by_length:
+                result += b'\x00' * (-len(result) % 8)
+                codes_offset = len(result)
+                result += self._codes_by_length[length].astype('<u8').tobytes()
+            _FILE_BUCKET.pack_into(result, _FILE_HEADER.size + i * _FILE_BUCKET.size, length, len(self._buckets[length]), rows_offset, codes_offset)
+        return bytes(result)
+
+    @staticmethod
+    def from_buffer(buffer, source_hash=None):
+        """
+            Deserializes a lexicon from a buffer without copying it (e.g. a memory-mapped file or shared memory).
+            Returns None if the buffer is invalid or was built from sources with a different hash.
+        """
+
+        # Validate the header
+        if len(buffer) < _FILE_HEADER.size:
+            return None
+        magic, version, buffer_hash, bucket_count = _FILE_HEADER.unpack_from(buffer, 0)
+        if magic != _FILE_MAGIC or version != _FILE_VERSION or (source_hash is not None and buffer_hash != source_hash):
+            return None
+
+        # Take buckets as views of the buffer
+        buckets = {}
+        codes_by_length = {}
+        for i in range(bucket_count):
+            length, count, rows_offset, codes_offset = _FILE_BUCKET.unpack_from(buffer, _FILE_HEADER.size + i * _FILE_BUCKET.size)
+            buckets[length] = np.frombuffer(buffer, dtype=np.uint8, count=count * length, offset=rows_offset).reshape(count, length)
+            if codes_offset > 0:
+                codes_by_length[length] = np.frombuffer(buffer, dtype='<u8', count=count, offset=codes_offset).astype(np.uint64, copy=False)
+
+        # Build the instance without going through words
+        lexicon = RuneLexicon.__new__(RuneLexicon)
+        lexicon._init_buckets(buckets, codes_by_length)
+        return lexicon
+
+    def save(self, path, source_hash):
+        """
+            Saves the lexicon to a binary file, along with a hash of the sources it was built from.
+        """
+
+        # Write everything
+        with open(path, 'wb') as fp:
+            fp.write(self.to_bytes(source_hash))
+
+    @staticmethod
+    def load(path, source_hash=None):
+        """
+            Loads a lexicon from a binary file by memory-mapping it.
+            Returns None if the file does not exist, is invalid or was built from sources with a different hash.
+        """
+
+        # Map the file
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return RuneLexicon.from_buffer(mapped, source_hash)
@@ -0,0 +1,142 @@
+from core import RUNES
+from core import runes_to_indices
+import numpy as np
+import struct
+import mmap
+import os
+
+# Number of runes in each n-gram and the number of possible n-grams
+NGRAM_SIZE = 4
+NGRAM_COUNT = len(RUNES) ** NGRAM_SIZE
+
+# Count given to n-grams never seen in training, relative to a single occurrence
+DEFAULT_FLOOR = 0.01
+
+# Compiled model file format: header (magic, version, source hash) followed by the log10 probability table
+_FILE_MAGIC = b'RQGM'
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sI32s')
+
+def get_ngram_codes(indices):
+    """
+        Encodes all overlapping quadgrams of the given indices (along the last axis, so matrices are encoded per row) to base-29 codes.
+    """
+
+    # Combine shifted views of the indices
+    indices = np.asarray(indices).astype(np.int64)
+    count = max(indices.shape[-1] - NGRAM_SIZE + 1, 0)
+    codes = indices[..., :count]
+    for offset in range(1, NGRAM_SIZE):
+        codes = codes * len(RUNES) + indices[..., offset:offset + count]
+    return codes
+
+class QuadgramModel(object):
+    """
+        A quadgram language model over Gematria indices, kept as a dense table of log10 probabilities of all 29^4 quadgrams.
+        Scores are log-likelihoods, so higher is more language-like and partially correct decryptions still score better than random ones.
+    """
+
+    def __init__(self, table):
+        """
+            Creates an instance from a table of log10 probabilities by quadgram code.
+        """
+
+        # Save the table as read-only
+        assert len(table) == NGRAM_COUNT, Exception(f'Table must have exactly {NGRAM_COUNT} entries')
+        self._table = np.asarray(table, dtype=np.float32)
+        self._table.flags.writeable = False
+
+    @staticmethod
+    def from_texts(texts, floor=DEFAULT_FLOOR):
+        """
+            Trains a model from texts given as runes or as arrays of indices.
+            Quadgrams never seen are given the floor count.
+        """
+
+        # Count all quadgrams of all texts at once
+        codes = [ get_ngram_codes(runes_to_indices(text) if isinstance(text, str) else text) for text in texts ]
+        counts = np.bincount(np.concatenate([ np.zeros(0, dtype=np.int64) ] + codes), minlength=NGRAM_COUNT).astype(np.float64)
+        assert counts.sum() > 0, Exception('No quadgrams to train from')
+
+        # Turn counts to log10 probabilities
+        return QuadgramModel(np.log10(np.maximum(counts, floor) / counts.sum()))
+
+    def get_table(self):
+        """
+            Gets the read-only table of log10 probabilities by quadgram code.
+        """
+
+        # Return the table
+        return self._table
+
+    def score_indices(self, indices):
+        """
+            Scores a single text given as indices.
+        """
+
+        # Sum all quadgram scores
+        return float(self._table[get_ngram_codes(indices)].sum(dtype=np.float64))
+
+    def score_batch(self, matrix):
+        """
+            Scores each row of the given N by L matrix of indices.
+        """
+
+        # Sum per row
+        return self._table[get_ngram_codes(matrix)].sum(axis=-1, dtype=np.float64)
+
+    def score(self, processed_text):
+        """
+            Scores a processed text.
+        """
+
+        # Score the runes regardless of punctuation
+        return self.score_indices(processed_text.view_indices())
+
+    def to_bytes(self, source_hash=b'\x00' * 32):
+        """
+            Serializes the model, along with a hash of the sources it was trained from.
+        """
+
+        # Header followed by the table
+        return _FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, source_hash) + self._table.astype('<f4').tobytes()
+
+    @staticmethod
+    def from_buffer(buffer, source_hash=None):
+        """
+            Deserializes a model from a buffer without copying it (e.g. a memory-mapped file or shared memory).
+            Returns None if the buffer is invalid or was trained from sources with a different hash.
+        """
+
+        # Validate the header
+        if len(buffer) != _FILE_HEADER.size + NGRAM_COUNT * 4:
+            return None
+        magic, version, buffer_hash = _FILE_HEADER.unpack_from(buffer, 0)
+        if magic != _FILE_MAGIC or version != _FILE_VERSION or (source_hash is not None and buffer_hash != source_hash):
+            return None
+
+        # Take the table as a view of the buffer
+        return QuadgramModel(np.frombuffer(buffer, dtype='<f4', count=NGRAM_COUNT, offset=_FILE_HEADER.size))
+
+    def save(self, path, source_hash):
+        """
+            Saves the model to a binary file, along with a hash of the sources it was trained from.
+        """
+
+        # Write everything
+        with open(path, 'wb') as fp:
+            fp.write(self.to_bytes(source_hash))
+
+    @staticmethod
+    def load(path, source_hash=None):
+        """
+            Loads a model from a binary file by memory-mapping it.
+            Returns None if the file does not exist, is invalid or was trained from sources with a different hash.
+        """
+
+        # Map the file
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return QuadgramModel.from_buffer(mapped, source_hash)
@@ -0,0 +1,135 @@
+import numpy as np
+
+# Initial bound of the tables, which grow on demand
+DEFAULT_BOUND = 1 << 16
+
+# Tables never grow beyond this bound, callers should fall back to factorization above it
+MAX_BOUND = 1 << 24
+
+class NumberTheoryTables(object):
+    """
+        Sieved tables of primes, Euler's totient function and the Mobius function.
+    """
+
+    def __init__(self, bound=DEFAULT_BOUND):
+        """
+            Creates an instance.
+        """
+
+        # Sieve up to the given bound
+        self._bound = 0
+        self._primes = np.zeros(0, dtype=np.int64)
+        self._is_prime = np.zeros(0, dtype=bool)
+        self._totient = np.zeros(0, dtype=np.int64)
+        self._mobius = np.zeros(0, dtype=np.int8)
+        self.ensure(bound)
+
+    def get_bound(self):
+        """
+            Gets the largest number covered by the tables.
+        """
+
+        # Return the bound
+        return self._bound
+
+    def ensure(self, bound):
+        """
+            Makes sure the tables cover all numbers up to the given bound, at least doubling them when growing.
+        """
+
+        # Nothing to do if already covered
+        if bound <= self._bound:
+            return
+        assert bound <= MAX_BOUND, Exception(f'Bound {bound} exceeds the maximum bound ({MAX_BOUND})')
+        bound = min(max(bound, self._bound * 2), MAX_BOUND)
+
+        # Sieve of Eratosthenes
+        is_prime = np.ones(bound + 1, dtype=bool)
+        is_prime[:2] = False
+        for p in range(2, int(bound ** 0.5) + 1):
+            if is_prime[p]:
+                is_prime[p * p::p] = False
+        primes = np.flatnonzero(is_prime)
+
+        # Each prime p removes a 1/p part of the totient of its multiples and flips the Mobius function sign of its multiples
+        totient = np.arange(bound + 1, dtype=np.int64)
+        mobius = np.ones(bound + 1, dtype=np.int8)
+        mobius[0] = 0
+        for p in primes.tolist():
+            totient[p::p] -= totient[p::p] // p
+            mobius[p::p] *= -1
+            mobius[p * p::p * p] = 0
+
+        # Save tables
+        self._bound = bound
+        self._primes = primes
+        self._is_prime = is_prime
+        self._totient = totient
+        self._mobius = mobius
+
+    def is_prime(self, n):
+        """
+            Indicates whether the given number is a prime.
+        """
+
+        # Lookup
+        self.ensure(n)
+        return bool(self._is_prime[n])
+
+    def next_prime(self, n):
+        """
+            Finds the smallest prime greater than the given number.
+        """
+
+        # Grow until there is a prime above the given number
+        while self._primes[-1] <= n:
+            self.ensure(self._bound * 2)
+        return int(self._primes[np.searchsorted(self._primes, n, side='right')])
+
+    def get_primes(self, count):
+        """
+            Gets the first primes.
+        """
+
+        # Grow until there are enough primes
+        while len(self._primes) < count:
+            self.ensure(self._bound * 2)
+        return self._primes[:count]
+
+    def get_totients(self, values, calls=1):
+        """
+            Applies the totient function on each of the given values, the given number of times.
+        """
+
+        # Each call just looks up the previous results
+        result = np.asarray(values, dtype=np.int64)
+        if len(result) > 0:
+            self.ensure(int(result.max()))
+        for i in range(calls):
+            result = self._totient[result]
+        return result
+
+    def get_mobius(self, values):
+        """
+            Applies the Mobius function on each of the given values.
+        """
+
+        # Lookup
+        values = np.asarray(values, dtype=np.int64)
+        if len(values) > 0:
+            self.ensure(int(values.max()))
+        return self._mobius[values].astype(np.int64)
+
+# Tables shared by the entire process
+_TABLES = None
+
+def get_tables():
+    """
+        Gets the number theory tables shared by the entire process.
+    """
+
+    # Create lazily
+    global _TABLES
+    if _TABLES is None:
+        _TABLES = NumberTheoryTables()
+    return _TABLES
@@ -0,0 +1,232 @@
+from core import RUNES
+from core import RUNE_INDICES
+from core import ProcessedText
+from transformers import VigenereTransformer
+from ngrams import NGRAM_SIZE
+from ngrams import get_ngram_codes
+from ngrams import QuadgramModel
+from scoring import VigenereEvaluation
+from executor import run_parallel_sweep
+import numpy as np
+import random
+import math
+
+# Default number of mutations per restart
+DEFAULT_ITERATIONS = 20000
+
+# Default starting temperature, in log10 probability units
+DEFAULT_TEMPERATURE = 10.0
+
+# Chance of toggling an interrupter instead of changing a key rune, when interrupters are searched
+INTERRUPTER_MUTATION_RATE = 0.1
+
+# Compiled models loaded by a worker, by path and source hash
+_worker_models = {}
+
+class IncrementalQuadgramScore(object):
+    """
+        The quadgram score of a text that changes a few runes at a time, rescoring only the quadgrams that cover changed runes.
+    """
+
+    def __init__(self, model, indices):
+        """
+            Creates an instance for the given model and initial indices.
+        """
+
+        # Keep the score of each quadgram
+        self._table = model.get_table()
+        self._indices = np.array(indices, dtype=np.int64)
+        self._quadgram_scores = self._table[get_ngram_codes(self._indices)].astype(np.float64)
+        self._score = float(self._quadgram_scores.sum())
+
+    def get_quadgram_score(self):
+        """
+            Gets the current score.
+        """
+
+        # Return the score
+        return self._score
+
+    def get_indices(self):
+        """
+            Gets a copy of the current indices.
+        """
+
+        # Copy
+        return self._indices.copy()
+
+    def try_change(self, positions, values):
+        """
+            Evaluates setting the given positions to the given values, without changing anything.
+            Returns the new score and a change that can be given to apply.
+        """
+
+        # Find all quadgrams that cover any of the positions
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = (positions[:, None] - np.arange(NGRAM_SIZE)[None, :]).ravel()
+        starts = np.unique(starts[(starts >= 0) & (starts < len(self._quadgram_scores))])
+
+        # Rescore them with the new values
+        indices = self._indices.copy()
+        indices[positions] = values
+        codes = indices[starts]
+        for offset in range(1, NGRAM_SIZE):
+            codes = codes * len(RUNES) + indices[starts + offset]
+        new_scores = self._table[codes].astype(np.float64)
+        return self._score + float(new_scores.sum() - self._quadgram_scores[starts].sum()), (indices, starts, new_scores)
+
+    def apply(self, new_score, change):
+        """
+            Applies a change returned by try_change.
+        """
+
+        # Replace indices and quadgram scores
+        indices, starts, new_scores = change
+        self._indices = indices
+        self._quadgram_scores[starts] = new_scores
+        self._score = new_score
+
+class KeyAnnealer(object):
+    """
+        Searches for the key (and optionally interrupters) of a key-based transformer with simulated annealing over quadgram scores.
+        Keys are mutated one rune at a time, which lets Vigenere decrypt and rescore only the runes that key rune affects.
+        Other transformers (e.g. Autokey) decrypt entirely and rescore only the runes that changed.
+    """
+
+    def __init__(self, processed_text, model, key_length, transformer_class=VigenereTransformer, transformer_params={}, interrupt_indices=set(), interrupter_rune=None):
+        """
+            Creates an instance.
+            The transformer class is created as transformer_class(key=key, interrupt_indices=interrupt_indices, **transformer_params).
+            If an interrupter rune is given, interrupters are searched among the positions of that rune, starting from the given interrupters.
+        """
+
+        # Save the ciphertext and the search parameters
+        self._processed_text = processed_text
+        self._ciphertext = processed_text.get_indices().astype(np.int64)
+        self._model = model
+        self._key_length = key_length
+        self._transformer_class = transformer_class
+        self._transformer_params = transformer_params
+        self._initial_interrupt_indices = set(interrupt_indices)
+        self._interrupter_candidates = [] if interrupter_rune is None else np.flatnonzero(self._ciphertext == RUNE_INDICES[interrupter_rune]).tolist()
+
+    def decrypt(self, key, interrupt_indices):
+        """
+            Decrypts the ciphertext with the given key (as indices) and interrupters.
+        """
+
+        # Run the transformer on a clone
+        pt = ProcessedText.from_processed_text(self._processed_text)
+        self._transformer_class(key=''.join([ RUNES[k] for k in key ]), interrupt_indices=interrupt_indices, **self._transformer_params).transform(pt)
+        return pt.get_indices().astype(np.int64)
+
+    def _create_state(self, key, interrupt_indices):
+        """
+            Creates the incremental evaluation state of a key and interrupters.
+        """
+
+        # Vigenere has a dedicated state that updates per key rune
+        if self._transformer_class is VigenereTransformer:
+            return VigenereEvaluation(self._processed_text, self._model, key, interrupt_indices)
+        return IncrementalQuadgramScore(self._model, self.decrypt(key, interrupt_indices))
+
+    def _propose(self, state, key, interrupt_indices, slot):
+        """
+            Evaluates a mutation of either a key rune (if a slot is given) or the interrupters.
+            Returns the new score along with either a new state or a change to apply on the current state.
+        """
+
+        # Vigenere key runes only affect their own positions, while new interrupters move all key positions
+        if isinstance(state, VigenereEvaluation):
+            if slot is None:
+                new_state = self._create_state(key, interrupt_indices)
+                return new_state.get_quadgram_score(), new_state, None
+            new_score, change = state.try_key_rune(slot, key[slot])
+            return new_score, None, change
+
+        # Everything else is decrypted and compared
+        decrypted = self.decrypt(key, interrupt_indices)
+        positions = np.flatnonzero(decrypted != state.get_indices())
+        new_score, change = state.try_change(positions, decrypted[positions])
+        return new_score, None, change
+
+    def run(self, iterations=DEFAULT_ITERATIONS, temperature=DEFAULT_TEMPERATURE, seed=None):
+        """
+            Runs a single annealing from a random key, cooling linearly to zero.
+            Returns the best score, key (in runes) and interrupters found.
+        """
+
+        # Start from a random key
+        rng = random.Random(seed)
+        key = [ rng.randrange(len(RUNES)) for i in range(self._key_length) ]
+        interrupt_indices = set(self._initial_interrupt_indices)
+        state = self._create_state(key, interrupt_indices)
+        best = (state.get_quadgram_score(), key[:], set(interrupt_indices))
+
+        # Mutate either a key rune or an interrupter
+        for iteration in range(iterations):
+            current_temperature = temperature * (1.0 - iteration / iterations)
+            new_key = key
+            new_interrupt_indices = interrupt_indices
+            slot = None
+            if len(self._interrupter_candidates) > 0 and rng.random() < INTERRUPTER_MUTATION_RATE:
+                new_interrupt_indices = interrupt_indices ^ { rng.choice(self._interrupter_candidates) }
+            else:
+                slot = rng.randrange(self._key_length)
+                new_key = key[:]
+                new_key[slot] = (key[slot] + rng.randrange(1, len(RUNES))) % len(RUNES)
+            new_score, new_state, change = self._propose(state, new_key, new_interrupt_indices, slot)
+
+            # Accept improvements and sometimes accept worse states
+            delta = new_score - state.get_quadgram_score()
+            if delta >= 0 or (current_temperature > 0 and rng.random() < math.exp(delta / current_temperature)):
+                if new_state is None:
+                    state.apply(new_score, change)
+                else:
+                    state = new_state
+                key, interrupt_indices = new_key, new_interrupt_indices
+                if new_score > best[0]:
+                    best = (new_score, key[:], set(interrupt_indices))
+
+        # Return the best state
+        return best[0], ''.join([ RUNES[k] for k in best[1] ]), best[2]
+
+def _get_worker_model(model_path, source_hash):
+    """
+        Gets a compiled quadgram model in a worker, memory-mapped once per worker.
+    """
+
+    # Load lazily
+    if (model_path, source_hash) not in _worker_models:
+        model = QuadgramModel.load(model_path, source_hash)
+        assert model is not None, Exception(f'Compiled quadgram model {model_path} is missing or stale')
+        _worker_models[(model_path, source_hash)] = model
+    return _worker_models[(model_path, source_hash)]
+
+def evaluate_annealing_restart(context, task):
+    """
+        Runs a single annealing restart as a parallel sweep task.
+        Task is a tuple of page index, key length and seed, and the sweep data is a tuple of the compiled model path, its source hash, transformer class,
+        transformer parameters, interrupter rune, iterations and temperature.
+    """
+
+    # Run and report the result as a hit
+    page_index, key_length, seed = task
+    model_path, source_hash, transformer_class, transformer_params, interrupter_rune, iterations, temperature = context.data
+    model = _get_worker_model(model_path, source_hash)
+    annealer = KeyAnnealer(context.pages[page_index], model, key_length, transformer_class, transformer_params, interrupter_rune=interrupter_rune)
+    score, key, interrupt_indices = annealer.run(iterations, temperature, seed)
+    return [ (page_index, key_length, seed, score, key, interrupt_indices) ]
+
+def run_parallel_annealing(pages, model_path, source_hash, key_lengths, restarts, transformer_class=VigenereTransformer, transformer_params={}, interrupter_rune=None, iterations=DEFAULT_ITERATIONS, temperature=DEFAULT_TEMPERATURE, workers=None, checkpoint_path=None):
+    """
+        Runs annealing restarts for each page and key length across worker processes, yielding results as they finish.
+        Each result is a tuple of page index, key length, seed, score, key and interrupters.
+        The model is given as the path of a compiled model and the hash of its sources, so workers memory-map it instead of receiving a copy.
+        If a checkpoint path is given, finished restarts are saved to it and an interrupted run resumes from it (see run_parallel_sweep).
+    """
+
+    # Every restart is a task with its own seed
+    tasks = [ (page_index, key_length, seed) for page_index in range(len(pages)) for key_length in key_lengths for seed in range(restarts) ]
+    data = (model_path, source_hash, transformer_class, transformer_params, interrupter_rune, iterations, temperature)
+    yield from run_parallel_sweep(evaluate_annealing_restart, tasks, pages, data=data, workers=workers, chunk_size=1, desc='Annealing', checkpoint_path=checkpoint_path)
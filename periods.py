@@ -0,0 +1,108 @@
+from core import RUNES
+from stats import get_periodic_ioc
+import numpy as np
+
+# Default range of periods to analyze
+DEFAULT_MAX_PERIOD = 30
+
+# Length of repeated sequences that Kasiski examination looks for
+KASISKI_NGRAM_SIZE = 3
+
+def get_language_frequencies(texts):
+    """
+        Gets the relative frequency of each rune in the given texts (as arrays of indices), e.g. decrypted solved pages.
+    """
+
+    # Count all texts at once
+    counts = np.bincount(np.concatenate([ np.asarray(text, dtype=np.int64) for text in texts ]), minlength=len(RUNES)).astype(np.float64)
+    return counts / counts.sum()
+
+def get_friedman_estimates(texts, language_frequencies):
+    """
+        Estimates the Vigenere key length of each of the given texts with the Friedman test.
+    """
+
+    # Compare the raw IoC of each text with the IoC of the language and of uniformly random runes, correcting for the text length
+    # Texts that look no less random than uniformly random runes are estimated to have a key as long as themselves
+    language_ioc = float((language_frequencies ** 2).sum())
+    random_ioc = 1.0 / len(RUNES)
+    result = np.zeros(len(texts))
+    for text_index, text in enumerate(texts):
+        counts = np.bincount(np.asarray(text, dtype=np.int64), minlength=len(RUNES))
+        total = int(counts.sum())
+        if total < 2:
+            continue
+        observed_ioc = (counts * (counts - 1)).sum() / (total * (total - 1))
+        denominator = (total - 1) * observed_ioc - total * random_ioc + language_ioc
+        result[text_index] = total if denominator <= 0 else min((language_ioc - random_ioc) * total / denominator, total)
+    return result
+
+def get_kasiski_scores(texts, periods):
+    """
+        Gets the fraction of distances between repeated trigrams that each period divides, for each of the given texts, as an N by P array.
+    """
+
+    # Find the distances between every two occurrences of the same trigram
+    periods = np.asarray(periods, dtype=np.int64)
+    result = np.zeros((len(texts), len(periods)))
+    for text_index, text in enumerate(texts):
+        text = np.asarray(text, dtype=np.int64)
+        count = len(text) - KASISKI_NGRAM_SIZE + 1
+        if count < 2:
+            continue
+        codes = text[:count] * len(RUNES) ** 2 + text[1:count + 1] * len(RUNES) + text[2:count + 2]
+        order = np.argsort(codes, kind='stable')
+        same = codes[order][1:] == codes[order][:-1]
+        distances = (order[1:] - order[:-1])[same]
+
+        # Score all periods at once
+        if len(distances) > 0:
+            result[text_index] = (distances[:, None] % periods[None, :] == 0).mean(axis=0)
+    return result
+
+def get_column_key(text, period, language_frequencies):
+    """
+        Finds the Vigenere key of the given period that best fits the language frequencies, one column at a time.
+        Returns the key (as indices) and the chi-squared statistic of each column.
+    """
+
+    # Count each column
+    text = np.asarray(text, dtype=np.int64)
+    counts = np.bincount((np.arange(len(text)) % period) * len(RUNES) + text, minlength=period * len(RUNES)).reshape(period, len(RUNES))
+
+    # Decrypting with key rune k turns the count of cipher rune (j + k) to the count of plain rune j, so try all key runes at once
+    shifts = (np.arange(len(RUNES))[:, None] + np.arange(len(RUNES))[None, :]) % len(RUNES)
+    plain_counts = counts[:, shifts]
+    expected = np.broadcast_to(counts.sum(axis=1)[:, None, None] * np.maximum(language_frequencies, 1e-9)[None, None, :], plain_counts.shape)
+    chi_squared = np.divide((plain_counts - expected) ** 2, expected, out=np.zeros(plain_counts.shape), where=expected > 0).sum(axis=2)
+    key = chi_squared.argmin(axis=1)
+    return key, chi_squared[np.arange(period), key]
+
+def analyze_periods(texts, language_frequencies, max_period=DEFAULT_MAX_PERIOD, top=3):
+    """
+        Analyzes the periodicity of each of the given texts (as arrays of indices) for periods 1 to the given maximum.
+        Returns a list with a dictionary per text, holding the Friedman estimate and the top periods ranked by average column IoC,
+        each with its Kasiski score and best fitting Vigenere key (in runes).
+    """
+
+    # Compute all periods of all texts at once
+    periods = list(range(1, max_period + 1))
+    column_iocs = get_periodic_ioc(list(texts), periods)
+    kasiski_scores = get_kasiski_scores(texts, periods)
+    friedman_estimates = get_friedman_estimates(texts, language_frequencies)
+
+    # Rank periods and fit keys for the best ones
+    result = []
+    for text_index, text in enumerate(texts):
+        ranked = []
+        for period_index in np.argsort(-column_iocs[text_index], kind='stable')[:top].tolist():
+            key, chi_squared = get_column_key(text, periods[period_index], language_frequencies)
+            ranked.append({
+                'period' : periods[period_index],
+                'column_ioc' : float(column_iocs[text_index, period_index]),
+                'kasiski' : float(kasiski_scores[text_index, period_index]),
+                'key' : ''.join([ RUNES[k] for k in key.tolist() ]),
+                'chi_squared' : float(chi_squared.mean())
+            })
+        result.append({ 'friedman' : float(friedman_estimates[text_index]), 'periods' : ranked })
+    return result
@@ -0,0 +1,119 @@
+from core import ProcessedText
+import itertools
+
+class Stage(object):
+    """
+        A stage of a sweep plan: a named set of transformer options, of which every pipeline takes exactly one (or none, if the stage is optional).
+    """
+
+    def __init__(self, name, options, optional=False):
+        """
+            Creates an instance.
+            Options are tuples of a description and a transformer.
+        """
+
+        # Save the options
+        assert len(options) > 0, Exception(f'Stage {name} has no options')
+        self.name = name
+        self.options = list(options)
+        self.optional = optional
+
+class PlanNode(object):
+    """
+        A node of a sweep plan prefix tree: a single transformer applied to the output of its parent.
+    """
+
+    def __init__(self, description=None, transformer=None):
+        """
+            Creates an instance.
+        """
+
+        # Children are kept by stage name and option index
+        self.description = description
+        self.transformer = transformer
+        self.children = {}
+        self.is_pipeline = False
+
+class SweepPlan(object):
+    """
+        A declarative description of a combinatorial sweep: stages, their options and ordering constraints between stages.
+        All pipelines (every order of the stages that satisfies the constraints, with every combination of options) are expanded into a prefix tree,
+        so pipelines that share a prefix (e.g. "Reverse then Autokey") compute it once and every downstream branch reuses its output.
+    """
+
+    def __init__(self, stages, orderings=[]):
+        """
+            Creates an instance.
+            Orderings are tuples of two stage names, where the first stage must come before the second one.
+            Stages that are not constrained are tried in every order.
+        """
+
+        # Validate constraints
+        names = [ stage.name for stage in stages ]
+        assert len(set(names)) == len(names), Exception('Stage names must be unique')
+        assert all([ before in names and after in names for before, after in orderings ]), Exception('Unknown stage in orderings')
+
+        # Insert every pipeline of every valid order, where skipped stages do not add nodes so equal pipelines end up on the same path
+        self._root = PlanNode()
+        self._pipeline_count = 0
+        self._node_count = 0
+        for order in itertools.permutations(stages):
+            positions = { stage.name : position for position, stage in enumerate(order) }
+            if any([ positions[before] > positions[after] for before, after in orderings ]):
+                continue
+            for choices in itertools.product(*[ list(enumerate(stage.options)) + ([ None ] if stage.optional else []) for stage in order ]):
+                self._insert([ (stage.name, choice) for stage, choice in zip(order, choices) if choice is not None ])
+
+    def _insert(self, path):
+        """
+            Inserts a single pipeline, given as stage names and indexed options.
+        """
+
+        # Walk down, creating nodes as needed
+        node = self._root
+        for name, (option_index, (description, transformer)) in path:
+            key = (name, option_index)
+            if key not in node.children:
+                node.children[key] = PlanNode(description, transformer)
+                self._node_count += 1
+            node = node.children[key]
+        if not node.is_pipeline:
+            node.is_pipeline = True
+            self._pipeline_count += 1
+
+    def __len__(self):
+        """
+            Gets the number of distinct pipelines.
+        """
+
+        # Counted while inserting
+        return self._pipeline_count
+
+    def get_node_count(self):
+        """
+            Gets the number of transformations a single execution applies, which is the number of nodes in the prefix tree.
+        """
+
+        # Counted while inserting
+        return self._node_count
+
+    def execute(self, processed_text):
+        """
+            Runs all pipelines on the given processed text, which is left as is.
+            Yields a list of the descriptions of each pipeline along with its output, which must not be modified.
+        """
+
+        # The empty pipeline (every stage skipped) outputs the text as is
+        if self._root.is_pipeline:
+            yield [], ProcessedText.from_processed_text(processed_text)
+
+        # Walk the tree depth first, transforming a copy-on-write clone of the parent output at each node
+        stack = [ (child, [], processed_text) for child in reversed(list(self._root.children.values())) ]
+        while len(stack) > 0:
+            node, descriptions, parent_pt = stack.pop()
+            pt = ProcessedText.from_processed_text(parent_pt)
+            node.transformer.transform(pt)
+            descriptions = descriptions + [ node.description ]
+            if node.is_pipeline:
+                yield descriptions, pt
+            stack += [ (child, descriptions, pt) for child in reversed(list(node.children.values())) ]
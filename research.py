@@ -7,13 +7,53 @@ from core import latin_to_runes
 from core import PAGE_NAMES
 import secrets
 from transformers import *
+from batch import vigenere_decrypt_batch
+from batch import autokey_decrypt_batch
+from batch import score_shift_atbash_variants
+from batch import SHIFT_ATBASH_VARIANTS
+from batch import get_rune_ioc_batch
+from batch import get_first_non_wordlist_word_index_batch
+from lexicon import RuneLexicon
+from lexicon import hash_files
+from ngrams import QuadgramModel
+from executor import run_parallel_sweep
+from plans import Stage
+from plans import SweepPlan
+from optimizer import run_parallel_annealing
+from periods import analyze_periods
+from periods import get_language_frequencies
+from cribs import CribEngine
+from cribs import get_crib_plaintexts
+from cribs import FragmentKeySource
+from cribs import PeriodicKeySource
+from cribs import get_default_fragment_sources
+from fragments import FragmentIndex
 import os
 import itertools
 import sys
 from tqdm import tqdm
 import string
+import numpy as np
 import screen
 
+# Compiled lexicon path and the sources it is built from
+COMPILED_LEXICON_PATH = 'rune_lexicon.bin'
+COMPILED_LEXICON_SOURCES = [ 'english_wordlist.txt', 'pages.py' ]
+
+# Compiled quadgram model path and the sources it is built from
+COMPILED_QUADGRAMS_PATH = 'rune_quadgrams.bin'
+COMPILED_QUADGRAMS_SOURCES = COMPILED_LEXICON_SOURCES + [ 'ngrams.py' ]
+
+# Compiled key fragment index path and the sources it is built from
+COMPILED_FRAGMENTS_PATH = 'rune_fragments.bin'
+COMPILED_FRAGMENTS_SOURCES = COMPILED_LEXICON_SOURCES + [ 'keystreams.py', 'cribs.py', 'fragments.py' ]
+
+# Checkpoints of interrupted parallel sweeps, by sweep name, which let them resume where they stopped
+CHECKPOINT_PATH_FORMAT = 'checkpoint_{}.bin'
+
+# Ranked crib results path
+CRIB_RESULTS_PATH = 'crib_results.txt'
+
 def get_unsolved_pages():
     """
         Gets all unsolved pages.
@@ -69,6 +109,82 @@ def get_rune_wordlist(use_dictionary=False):
     # Return wordlist sorted by word length descending
     return sorted(result, key=len)[::-1]
 
+def get_rune_lexicon(use_dictionary=False):
+    """
+        Get a Runic lexicon (fast membership tests) from all solved pages dynamically.
+        Can also extend to an English wordlist, in which case the lexicon is compiled to a file and only rebuilt when its sources change.
+    """
+
+    # Without the dictionary building is cheap
+    if not use_dictionary:
+        return RuneLexicon(get_rune_wordlist())
+
+    # Load the compiled lexicon unless its sources changed
+    source_hash = hash_files(COMPILED_LEXICON_SOURCES)
+    lexicon = RuneLexicon.load(COMPILED_LEXICON_PATH, source_hash)
+    if lexicon is None:
+        RuneLexicon(get_rune_wordlist(True)).save(COMPILED_LEXICON_PATH, source_hash)
+        lexicon = RuneLexicon.load(COMPILED_LEXICON_PATH, source_hash)
+    return lexicon
+
+def get_solved_page_indices():
+    """
+        Gets the decrypted Gematria indices of all solved pages.
+    """
+
+    # Decrypt all pages and only keep the solved ones
+    result = []
+    for page in PAGES:
+        processed_text = ProcessedText(page[0])
+        page[1].transform(processed_text)
+        if not processed_text.is_unsolved():
+            result.append(processed_text.view_indices())
+    return result
+
+def get_quadgram_model():
+    """
+        Gets a quadgram model trained from all solved pages and the English wordlist.
+        The model is compiled to a file and only retrained when its sources change.
+    """
+
+    # Load the compiled model unless its sources changed
+    source_hash = hash_files(COMPILED_QUADGRAMS_SOURCES)
+    model = QuadgramModel.load(COMPILED_QUADGRAMS_PATH, source_hash)
+    if model is None:
+        with open('english_wordlist.txt', 'r') as fp:
+            words = [ latin_to_runes(word) for word in fp.read().split('\n') ]
+        QuadgramModel.from_texts(get_solved_page_indices() + words).save(COMPILED_QUADGRAMS_PATH, source_hash)
+        model = QuadgramModel.load(COMPILED_QUADGRAMS_PATH, source_hash)
+    return model
+
+def get_fragment_index():
+    """
+        Gets a key fragment index over the extended lexicon words, the solved pages and windows of the default keystreams (both added and substracted).
+        The index is compiled to a file and only rebuilt when its sources change.
+    """
+
+    # Load the compiled index unless its sources changed
+    source_hash = hash_files(COMPILED_FRAGMENTS_SOURCES)
+    index = FragmentIndex.load(COMPILED_FRAGMENTS_PATH, source_hash)
+    if index is None:
+
+        # Words and keystreams are the default sources
+        names, sources, repeating = get_default_fragment_sources(get_rune_lexicon(True))
+
+        # Solved pages run once
+        for page_index, page in enumerate(PAGES):
+            processed_text = ProcessedText(page[0])
+            page[1].transform(processed_text)
+            if not processed_text.is_unsolved():
+                names.append(f'Solved page {page_index}')
+                sources.append(processed_text.view_indices())
+                repeating.append(False)
+
+        # Build and save
+        FragmentIndex(names, sources, repeating).save(COMPILED_FRAGMENTS_PATH, source_hash)
+        index = FragmentIndex.load(COMPILED_FRAGMENTS_PATH, source_hash)
+    return index
+
 def runes_to_latin(runes):
     """
         Turns runes to latin, assuming input is only runes.
@@ -85,62 +201,150 @@ def indices_to_latin(indices):
     # Translate to runes and then to latin
     return runes_to_latin(''.join([ RUNES[i] for i in indices ]))
 
-def auto_crib_get_keys():
+def latin_to_indices(latin):
     """
-        Tries to solve each unsolved page that has enough words at the beginning of a sentence using a crib.
+        Turns latin to indices.
     """
 
-    # Get the word list
-    wordlist = get_rune_wordlist()
+    # Translate to runes and then to indices
+    return ProcessedText(latin_to_runes(latin)).get_indices()
 
-    # Iterate all unsolved pages
-    for page in get_unsolved_pages():
+def find_key_fragment(indices):
+    """
+        Finds every lexicon word, solved page and keystream window that contains the given key fragment (as indices).
+        Returns a list of tuples of the source name, the offset of the fragment within it and the source in latin.
+    """
 
-        # Get all words until a period
-        header_words = ProcessedText(page.split('.')[0]).get_rune_words()
-        if len(header_words) == 0:
-            continue
-        header_words_lengths = [ len(w) for w in header_words ]
-        # JBO
-        if header_words_lengths != [2, 6, 3, 5]:
-            continue
-        # JBO
-        ciphertext_runes = ''.join(header_words)
-
-        # Iterate all word combinations for each word length
-        all_plaintext_options = [ [ w for w in wordlist if len(w) == w_len ] for w_len in header_words_lengths ]
-        total_options = 1
-        for opt_list in all_plaintext_options:
-            total_options *= len(opt_list)
-        option_index = 0
-        for plaintext_option in itertools.product(*all_plaintext_options):
-
-            # Increase option index
-            option_index += 1
-
-            # JBO
-            #if runes_to_latin(plaintext_option[0]) != 'AN':
-            #    continue
-            #if runes_to_latin(plaintext_option[1]) in ('PRESERVATIAN', 'VNREASONABLE'):
-            #    continue
-            # JBO
-
-            # Should skip?
-            if 'Y' != input(' '.join(map(runes_to_latin, plaintext_option)) + f'\t{option_index}/{total_options}\tLooks good? [Y/N]: '):
-                continue
-            #print(' '.join(map(runes_to_latin, plaintext_option)) + f'\t{option_index}/{total_options}')
+    # Look up the fragment in the compiled index
+    index = get_fragment_index()
+    return [ (index.get_name(source_index), offset, indices_to_latin(index.get_source(source_index).tolist())) for source_index, offset in index.find(indices) ]
+
+def find_latin_key_fragment(latin):
+    """
+        Finds every lexicon word, solved page and keystream window that contains the given key fragment (as latin).
+    """
 
-            # Saves key options
-            key_options = []
+    # Translate and find
+    return find_key_fragment(latin_to_indices(latin))
 
-            # Get the plaintext runes and get base key indices
-            plaintext_runes = ''.join(plaintext_option)
-            base_key_indices = [ (RUNES.index(ciphertext_runes[i]) - RUNES.index(plaintext_runes[i])) % len(RUNES) for i in range(len(plaintext_runes)) ]
-            
-            # Print for now
-            print('KEY: ' + indices_to_latin(base_key_indices))
+def auto_crib_get_keys(word_count=2, phrase=None, max_plaintexts=100000, top=10, output_path=CRIB_RESULTS_PATH):
+    """
+        Tries to solve each unsolved page using a crib at its beginning: either a known phrase or combinations of solved words matching the header word lengths.
+        Keys implied by each candidate plaintext are looked up in the key fragment index and among repeating keys, and results are ranked and written to the output file.
+        Only keys that decrypt at least one word past the crib are kept, since every key found decrypts the crib itself. Interrupters are not taken into account.
+    """
+
+    # Candidate plaintexts come from solved words while keys are scored with the extended lexicon
+    crib_lexicon = get_rune_lexicon()
+    engine = CribEngine(get_rune_lexicon(True), [ FragmentKeySource(get_fragment_index()), PeriodicKeySource() ])
+    crib_word_count = len(phrase.split()) if phrase is not None else word_count
+
+    # Crib every unsolved page
+    with open(output_path, 'w') as fp:
+        page_index = -1
+        for page in tqdm(get_unsolved_pages(), desc='Pages being cribbed'):
+            page_index += 1
+            processed_text = ProcessedText(page)
+            plaintexts = get_crib_plaintexts(processed_text, crib_lexicon, phrase, word_count, max_plaintexts=max_plaintexts)
+            results = engine.crib(processed_text, plaintexts, min_words=crib_word_count + 1)
+
+            # Write all results and show the best ones
+            fp.write(f'PAGE {page_index}:\n')
+            for word_count_found, plaintext, description, key in results:
+                fp.write(f'\t{word_count_found}\t{runes_to_latin(plaintext)}\t{description}\t{indices_to_latin(key[:len(plaintext)])}\n')
+            for word_count_found, plaintext, description, key in results[:top]:
+                screen.print_yellow(f'PAGE {page_index}: WordMatchers={word_count_found}, Crib={runes_to_latin(plaintext)}, {description}')
+                print(CribEngine.decrypt(processed_text, key).to_latin())
+
+def evaluate_vigenere_keys(context, task):
+    """
+        Evaluates a batch of Vigenere keys on a single page, as a parallel sweep task.
+        Task is a tuple of page index and the index of the first key, and the sweep data is a tuple of keys, batch size, word threshold and IoC threshold.
+    """
+
+    # Unpack the task
+    page_index, batch_start = task
+    keys, batch_size, word_threshold, ioc_threshold = context.data
+    batch_keys = keys[batch_start:batch_start + batch_size]
+    hits = []
+
+    # Decrypt with all keys at once
+    page_pt = context.get_page(page_index)
+    matrix = vigenere_decrypt_batch(page_pt, batch_keys)
+    word_matches = get_first_non_wordlist_word_index_batch(matrix, page_pt.get_word_spans(), context.lexicon)
+    iocs = get_rune_ioc_batch(matrix)
+    for row in np.flatnonzero((word_matches >= word_threshold) | (iocs >= ioc_threshold)).tolist():
+        pt = ProcessedText.from_processed_text(page_pt)
+        pt.set_indices(matrix[row])
+        hits.append((page_index, f'Vigenere Key={batch_keys[row]}, IOC={iocs[row]}, WordMatchers={word_matches[row]}', pt.to_latin()))
+
+    # Return all hits
+    return hits
+
+def evaluate_autokey_keys(context, task):
+    """
+        Evaluates a batch of Autokey keys on a single page in all modes, with and without reversing, as a parallel sweep task.
+        Task is a tuple of page index and the index of the first key, and the sweep data is a tuple of keys, batch size, word threshold and IoC threshold.
+    """
 
-def bruteforce_autokey(word_match_threashold):
+    # Unpack the task
+    page_index, batch_start = task
+    keys, batch_size, word_threshold, ioc_threshold = context.data
+    batch_keys = keys[batch_start:batch_start + batch_size]
+    hits = []
+
+    # Decrypt either the page or the reversed page
+    page_pt = context.get_page(page_index)
+    reversed_pt = context.get_page(page_index)
+    ReverseTransformer().transform(reversed_pt)
+    word_spans = page_pt.get_word_spans()
+
+    # Iterate all modes
+    for mode in (AutokeyMode.PLAINTEXT, AutokeyMode.CIPHERTEXT, AutokeyMode.ALT_START_PLAINTEXT, AutokeyMode.ALT_START_CIPHERTEXT, AutokeyMode.ALT_MOBIUS_START_PLAINTEXT, AutokeyMode.ALT_MOBIUS_START_CIPHERTEXT):
+
+        # Either try or do not try GP-mode
+        for use_gp in (False, True):
+
+            # Apply Autokey, then reverse, and start from reversing and then apply Autokey
+            matrix = autokey_decrypt_batch(page_pt, batch_keys, mode, use_gp)
+            for prefix, suffix, candidates in (('', '', matrix), ('', ', reversed', matrix[:, ::-1]), ('Reversed text ', '', autokey_decrypt_batch(reversed_pt, batch_keys, mode, use_gp))):
+                candidates = np.ascontiguousarray(candidates)
+                word_matches = get_first_non_wordlist_word_index_batch(candidates, word_spans, context.lexicon)
+                iocs = get_rune_ioc_batch(candidates)
+                for row in np.flatnonzero((word_matches >= word_threshold) | (iocs >= ioc_threshold)).tolist():
+                    pt = ProcessedText.from_processed_text(page_pt)
+                    pt.set_indices(candidates[row])
+                    hits.append((page_index, f'{prefix}Autokey Key={batch_keys[row]}, mode={mode}{suffix}, IOC={iocs[row]}, WordMatchers={word_matches[row]}', pt.to_latin()))
+
+    # Return all hits
+    return hits
+
+def evaluate_autokey_shift_keys(context, task):
+    """
+        Evaluates a single Autokey key on a single page in all non-Mobius modes, scoring every Caesar shift with and without Atbash, as a parallel sweep task.
+        Task is a tuple of page index and key index, and the sweep data is a tuple of keys and word match threshold.
+    """
+
+    # Iterate all modes
+    page_index, key_index = task
+    keys, word_match_threashold = context.data
+    hits = []
+    for mode in [ AutokeyMode.PLAINTEXT, AutokeyMode.CIPHERTEXT, AutokeyMode.ALT_START_PLAINTEXT, AutokeyMode.ALT_START_CIPHERTEXT ]:
+
+        # Run autokey and score every Caesar shift, with and without Atbash, at once
+        autokey_pt = context.get_page(page_index)
+        AutokeyTransformer(key=keys[key_index], mode=mode).transform(autokey_pt)
+        scores = score_shift_atbash_variants(autokey_pt, context.lexicon)
+        for variant_index in np.flatnonzero(scores['word_matches'] > word_match_threashold).tolist():
+            shift, atbash = SHIFT_ATBASH_VARIANTS[variant_index]
+            shift_pt = ProcessedText.from_processed_text(autokey_pt)
+            shift_pt.set_indices(scores['variants'][variant_index])
+            hits.append((page_index, shift, atbash, int(scores['word_matches'][variant_index]), shift_pt.to_latin()))
+
+    # Return all hits
+    return hits
+
+def bruteforce_autokey(word_match_threashold, workers=None):
     """
         Tries Autokey in all modes given a key, with and without Atbash and\or Caesar and\or totient-prime substruction.
     """
@@ -156,167 +360,127 @@ def bruteforce_autokey(word_match_threashold):
     potential_keys = [ latin_to_runes(k) for k in potential_keys ]
 
     # Get the wordlist and extend it to also include potential keys
-    wordlist = get_rune_wordlist()
-    wordlist += potential_keys
+    wordlist = RuneLexicon(get_rune_wordlist() + potential_keys)
 
-    # Extend key list to include rune "F" too for each word
+    # Extend key list to include rune "F" too for each word, keeping a stable order so an interrupted sweep can resume
     potential_keys += [ k.replace(k[0], RUNES[0]) for k in potential_keys ]
-    keys = list(set(potential_keys))
+    keys = sorted(set(potential_keys))
 
     # Get unresolved pages
     unsolved_pages = get_unsolved_pages()
-    page_index = 0
     unsolved_pages = unsolved_pages[-3:]        # JBO
-    for page in unsolved_pages:
-
-        # Increase page index
-        page_index += 1
-
-        # Iterate keys
-        key_index = 0
-        for key in keys:
-
-            # Increase key index
-            key_index += 1
-            print(f'Trying page {page_index} / {len(unsolved_pages)} and key {key_index} / {len(keys)}')
-
-            # Iterate all modes
-            for mode in [ AutokeyMode.PLAINTEXT, AutokeyMode.CIPHERTEXT, AutokeyMode.ALT_START_PLAINTEXT, AutokeyMode.ALT_START_CIPHERTEXT ]:
 
-                # Process text
-                autokey_pt = ProcessedText(page)
+    # Sweep all pages and keys in parallel
+    tasks = list(itertools.product(range(len(unsolved_pages)), range(len(keys))))
+    for page_index, shift, atbash, word_matches, latin in run_parallel_sweep(evaluate_autokey_shift_keys, tasks, unsolved_pages, wordlist, (keys, word_match_threashold), workers=workers, total=len(unsolved_pages) * len(keys), desc='Autokey shifts', checkpoint_path=CHECKPOINT_PATH_FORMAT.format('autokey_shifts')):
+        print(f'Page {page_index + 1} with shift {shift}{" and Atbash" if atbash else ""} has {word_matches} matches\n\n{latin}')
+        screen.press_enter()
 
-                # Run autokey and iterate each Caesar shift
-                AutokeyTransformer(key=key, mode=mode).transform(autokey_pt)
-                for shift in range(len(RUNES)):
-
-                    # Shift
-                    shift_pt = ProcessedText.from_processed_text(autokey_pt)
-                    ShiftTransformer(shift=shift).transform(shift_pt)
-                    if shift_pt.get_first_non_wordlist_word_index(wordlist) > word_match_threashold:
-                        print(f'Page {page} with shift {shift} has {shift_pt.get_first_non_wordlist_word_index(wordlist)} matches\n\n{shift_pt.to_latin()}')
-                        screen.press_enter()
+def get_autokey_mobius_plan(keys):
+    """
+        Gets the sweep plan of Autokey on Mobius chunks with the given three keys in all non-Mobius modes, with or without adding or substructing
+        totient-primes (either before or after Autokey) and with or without Atbash at the end.
+    """
 
-                    # Try Atbash
-                    AtbashTransformer().transform(shift_pt)
-                    if shift_pt.get_first_non_wordlist_word_index(wordlist) > word_match_threashold:
-                        print(f'Page {page_index} with shift {shift} and Atbash has {shift_pt.get_first_non_wordlist_word_index(wordlist)} matches\n\n{shift_pt.to_latin()}')
-                        screen.press_enter()
+    # Describe the stages and let the plan share prefixes between all combinations
+    modes = [ AutokeyMode.PLAINTEXT, AutokeyMode.CIPHERTEXT, AutokeyMode.ALT_START_PLAINTEXT, AutokeyMode.ALT_START_CIPHERTEXT ]
+    return SweepPlan([
+        Stage('Autokey', [ (f'AutokeyMobius Keys={",".join(keys)}, mode={mode}', AutokeyMobiusTransformer(keys=keys, mode=mode)) for mode in modes ]),
+        Stage('Totient', [ ('TotientPrime add', TotientPrimeTransformer(add=True)), ('TotientPrime sub', TotientPrimeTransformer(add=False)) ], optional=True),
+        Stage('Atbash', [ ('Atbash', AtbashTransformer()) ], optional=True)
+    ], [ ('Autokey', 'Atbash'), ('Totient', 'Atbash') ])
 
-def bruteforce_autokey_mobius():
+def evaluate_autokey_mobius_keys(context, task):
+    """
+        Evaluates a single permutation of three keys on a single page with the Autokey Mobius sweep plan, as a parallel sweep task.
+        Task is a tuple of page index and three key indices, and the sweep data is a tuple of keys and word match threshold.
+    """
 
-    # Get potential keys
-    with open('wordlist/words.txt', 'r') as fp:
-        potential_keys = [ k.upper() for k in fp.read().split('\n') ]
-    potential_keys = [ ''.join([ i for i in k if i.isupper() ]) ]
-    potential_keys = [ k for k in potential_keys if len(k) > 0 ] 
+    # Run all pipelines of the plan
+    page_index = task[0]
+    keys, word_match_threshold = context.data
+    hits = []
+    for descriptions, pt in get_autokey_mobius_plan([ keys[key_index] for key_index in task[1:] ]).execute(context.get_page(page_index)):
+        word_matches = pt.get_first_non_wordlist_word_index(context.lexicon)
+        if word_matches >= word_match_threshold:
+            hits.append((page_index, word_matches, ', '.join(descriptions), pt.to_latin()))
+    return hits
+
+def bruteforce_autokey_mobius(word_match_threshold=3, min_key_len=1, workers=None):
+    """
+        Tries Autokey on Mobius chunks with every permutation of three keys, with or without totient-primes and Atbash.
+        Results of each page are appended to a file as they are found, and sorted once all pages are done; an interrupted sweep resumes from its checkpoint.
+    """
 
-    # Turn all potential keys to runes
-    potential_keys = [ latin_to_runes(k) for k in potential_keys ]
+    # Get potential keys and extend them to also include rune "F" for each word
+    potential_keys = [ k for k in get_rune_wordlist() if len(k) >= min_key_len ]
+    potential_keys = sorted(set(potential_keys + [ k.replace(k[0], RUNES[0]) for k in potential_keys ]))
 
     # Get the wordlist and extend it to also include potential keys
-    wordlist = get_rune_wordlist()
-    wordlist += potential_keys
+    wordlist = RuneLexicon(get_rune_wordlist() + potential_keys)
 
-    # Extend key list to include rune "F" too for each word
-    potential_keys += [ k.replace(k[0], RUNES[0]) for k in potential_keys ]
-
-    # Get unresolved pages
+    # Start every page file over, since a resumed sweep yields the hits of its checkpoint again
     unsolved_pages = get_unsolved_pages()
+    for page_index in range(len(unsolved_pages)):
+        open(f'dbg_{page_index + 1}.txt', 'w').close()
+
+    # Sweep all pages and key permutations in parallel, appending each hit to its page file
+    # Tasks are generated since there are too many to list, and only depend on the pages and keys, so the checkpoint identifies them by their total
+    results = [ [] for page in unsolved_pages ]
+    tasks = ((page_index,) + keys for page_index in range(len(unsolved_pages)) for keys in itertools.permutations(range(len(potential_keys)), 3))
+    total = len(unsolved_pages) * len(potential_keys) * (len(potential_keys) - 1) * (len(potential_keys) - 2)
+    for page_index, word_matches, description, latin in run_parallel_sweep(evaluate_autokey_mobius_keys, tasks, unsolved_pages, wordlist, (potential_keys, word_match_threshold), workers=workers, total=total, desc='Autokey Mobius', checkpoint_path=CHECKPOINT_PATH_FORMAT.format('autokey_mobius')):
+        results[page_index].append((word_matches, description, latin))
+        with open(f'dbg_{page_index + 1}.txt', 'a') as fp:
+            fp.write(f'word matches: {word_matches}\n{description}\n{latin}\n\n=================\n\n')
+
+    # Sort all results
+    for page_index in range(len(unsolved_pages)):
+        results[page_index].sort()
+        with open(f'dbg_{page_index + 1}.txt', 'w') as fp:
+            for r in results[page_index]:
+                fp.write(f'word matches: {r[0]}\n{r[1]}\n{r[2]}\n\n=================\n\n')
+
+def evaluate_double_tot_index(context, task):
+    """
+        Evaluates adding or substructing either tot(primes) or tot(tot(primes)) on a single page, before or after reversing it, as a parallel sweep task.
+        Task is a tuple of page index, number of totient calls and whether to add, and the sweep data is a tuple of word threshold and IoC threshold.
+    """
 
-    # Threshold
-    word_match_threshold = 3
-
-    # Iterate pages
-    page_index = 0
-    for page in unsolved_pages:
-
-        # Store results
-        results = []
-
-        # Iterate keys
-        page_index += 1
-        key_index = 0
-        for keys in itertools.permutations(potential_keys, 3):
-
-            # Print stats
-            key_index += 1
-            print(f'Page {page_index} / {len(unsolved_pages)} ; Key {key_index} / {len(potential_keys) * (len(potential_keys) - 1) * (len(potential_keys) - 2)}')
-
-            # Build transformer options
-            for mode in [ AutokeyMode.PLAINTEXT, AutokeyMode.CIPHERTEXT, AutokeyMode.ALT_START_PLAINTEXT, AutokeyMode.ALT_START_CIPHERTEXT ]:
-  
-                # Build transformers
-                transformers = []
-                transformers.append( [ AutokeyMobiusTransformer(keys=keys, mode=mode) ])
-                transformers.append(TotientPrimeTransformer(add=True))
-                tranaformers.append(TotientPrimeTransformer(add=False))
-                transformers.append(AtbashTransformer())
-                
-                # Just autokey
-                pt = ProcessedText(page)
-                autokey_transformer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
-                atbash_transformer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
- 
-                # Autokey with tot-prime add
-                pt = ProcessedText(page)
-                autokey_transformer.transform(pt)
-                tot_prime_add_transofmer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
-                atbash_transformer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
- 
-                # Autokey with tot-prime sub
-                pt = ProcessedText(page)
-                autokey_transformer.transform(pt)
-                tot_prime_sub_transofmer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
-                atbash_transformer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
- 
-                # Tot-prime add with Autokey
-                pt = ProcessedText(page)
-                tot_prime_add_transofmer.transform(pt)
-                autokey_transformer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
-                atbash_transformer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
- 
-                # Tot-prime sub with Autokey
-                pt = ProcessedText(page)
-                tot_prime_sub_transofmer.transform(pt)
-                autokey_transformer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
-                atbash_transformer.transform(pt)
-                word_matches = pt.get_first_non_wordlist_word_index(wordlist)
-                if word_matches >= word_match_threshold:
-                    results.append((word_matches, pt.to_latin()))
- 
-        # Sort all results
-        results.sort()
-        with open(f'dbg_{page_index}.txt', 'w') as fp:
-            for r in results:
-                fp.write(f'word matches: {r[0]}\n{r[1]}\n\n=================\n\n')
+    # Try reversing and then run totient index manipulation, try without reversing and reverse after totient index manipulation
+    page_index, tot_call_count, add_option = task
+    word_threshold, ioc_threshold = context.data
+    hits = []
+    reversed_pt = context.get_page(page_index)
+    ReverseTransformer().transform(reversed_pt)
+    TotientPrimeTransformer(tot_calls=tot_call_count, add=add_option).transform(reversed_pt)
+    pt = context.get_page(page_index)
+    TotientPrimeTransformer(tot_calls=tot_call_count, add=add_option).transform(pt)
+    reversed_after_pt = ProcessedText.from_processed_text(pt)
+    ReverseTransformer().transform(reversed_after_pt)
+    for candidate in (reversed_pt, pt, reversed_after_pt):
+        word_matches = candidate.get_first_non_wordlist_word_index(context.lexicon)
+        if word_matches >= word_threshold or candidate.get_rune_ioc() >= ioc_threshold:
+            hits.append((page_index, candidate.get_rune_ioc(), word_matches, candidate.to_latin()))
+
+    # Return all hits
+    return hits
+
+def evaluate_missing_primes_2013(context, task):
+    """
+        Evaluates adding or substructing the Cicada 3301 message missing primes from 2013 as a keystream on a single page, as a parallel sweep task.
+        Task is a tuple of page index and whether to add, and the sweep data is a tuple of word threshold and IoC threshold.
+    """
+
+    # Try decryption
+    page_index, add = task
+    word_threshold, ioc_threshold = context.data
+    pt = context.get_page(page_index)
+    KeystreamTransformer(add=add, keystream='missing_primes_2013').transform(pt)
+    word_matches = pt.get_first_non_wordlist_word_index(context.lexicon)
+    if word_matches >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
+        return [ (page_index, pt.get_rune_ioc(), word_matches, pt.to_latin()) ]
+    return []
 
 class Attempts(object):
     """
@@ -393,73 +557,65 @@ class Attempts(object):
             screen.press_enter()
 
     @staticmethod
-    def double_tot_index_with_reversing(word_threshold=6, ioc_threshold=1.8):
+    def crib_unsolved_pages_headers(word_count=2, phrase=None):
         """
-            Adds or substructs either tot(primes) or tot(tot(primes)), on both normal text as well as reversed text.
-            If the number of prefixed words are above the given threshold or the IOC is above the given threshold, print result.
+            Cribs the beginning of each unsolved page (either with a known phrase or with solved words matching the header word lengths) and ranks the keys found.
         """
 
-        # Get an extended wordlist for a measurement
-        wordlist = get_rune_wordlist(True)
+        # Run the crib engine on all pages
+        auto_crib_get_keys(word_count, phrase)
 
-        # Iterate all pages
-        page_index = -1
-        for page in tqdm(get_unsolved_pages(), desc='Pages being analyzed'):
+    @staticmethod
+    def show_unsolved_pages_periods(max_period=30, top=3):
+        """
+            Shows the likely Vigenere periods of each unsolved page (average column IoC, Kasiski and Friedman) and the best fitting key of each.
+        """
 
-            # Increase page index
-            page_index += 1
+        # Analyze all pages at once against the rune frequencies of the solved pages
+        pages = get_unsolved_pages()
+        texts = [ ProcessedText(page).view_indices() for page in pages ]
+        analysis = analyze_periods(texts, get_language_frequencies(get_solved_page_indices()), max_period, top)
 
-            # Iterate all number of totient operations
-            for tot_call_count in range(1, 3):
-               
-                # Try adding or substructing
-                for add_option in (False, True):
-
-                    # Try reversing and then run totient index manipulation
-                    pt = ProcessedText(page)
-                    ReverseTransformer().transform(pt)
-                    TotientPrimeTransformer(tot_calls=tot_call_count, add=add_option).transform(pt)
-                    if pt.get_first_non_wordlist_word_index(wordlist) >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
-                        print(f'PAGE {page_index} (IOC={pt.get_rune_ioc()}, WordMatchers={pt.get_first_non_wordlist_word_index(wordlist)}):\n{pt.to_latin()}\n\n')
-
-                    # Try without reversing
-                    pt = ProcessedText(page)
-                    TotientPrimeTransformer(tot_calls=tot_call_count, add=add_option).transform(pt)
-                    if pt.get_first_non_wordlist_word_index(wordlist) >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
-                        print(f'PAGE {page_index} (IOC={pt.get_rune_ioc()}, WordMatchers={pt.get_first_non_wordlist_word_index(wordlist)}):\n{pt.to_latin()}\n\n')
-
-                    # Reverse after totient index manipulation
-                    ReverseTransformer().transform(pt)
-                    if pt.get_first_non_wordlist_word_index(wordlist) >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
-                        print(f'PAGE {page_index} (IOC={pt.get_rune_ioc()}, WordMatchers={pt.get_first_non_wordlist_word_index(wordlist)}):\n{pt.to_latin()}\n\n')
+        # Show a table per page
+        for page_index in range(len(pages)):
+            screen.print_yellow(f'PAGE {page_index} (Friedman={analysis[page_index]["friedman"]:.2f}):')
+            for result in analysis[page_index]['periods']:
+                print(f'\tPeriod={result["period"]}\tColumnIoC={result["column_ioc"]:.3f}\tKasiski={result["kasiski"]:.3f}\tChiSquared={result["chi_squared"]:.1f}\tKey={result["key"]} ({runes_to_latin(result["key"])})')
+            print('')
 
     @staticmethod
-    def use_2013_missing_primes(word_threshold=6, ioc_threshold=1.8):
+    def double_tot_index_with_reversing(word_threshold=6, ioc_threshold=1.8, workers=None):
         """
-            Attempts to use the Cicada 3301 message missing primes from 2013 as a keystream.
+            Adds or substructs either tot(primes) or tot(tot(primes)), on both normal text as well as reversed text.
+            If the number of prefixed words are above the given threshold or the IOC is above the given threshold, print result.
         """
 
         # Get an extended wordlist for a measurement
-        wordlist = get_rune_wordlist(True)
+        wordlist = get_rune_lexicon(True)
 
-        # Iterate all pages
-        page_index = -1
-        for page in tqdm(get_unsolved_pages()):
+        # Sweep all pages, number of totient operations and adding or substructing in parallel
+        pages = get_unsolved_pages()
+        tasks = list(itertools.product(range(len(pages)), range(1, 3), (False, True)))
+        for page_index, ioc, word_matches, latin in run_parallel_sweep(evaluate_double_tot_index, tasks, pages, wordlist, (word_threshold, ioc_threshold), workers=workers, chunk_size=1, desc='Pages being analyzed', checkpoint_path=CHECKPOINT_PATH_FORMAT.format('double_tot_index')):
+            print(f'PAGE {page_index} (IOC={ioc}, WordMatchers={word_matches}):\n{latin}\n\n')
 
-            # Increase page index
-            page_index += 1
+    @staticmethod
+    def use_2013_missing_primes(word_threshold=6, ioc_threshold=1.8, workers=None):
+        """
+            Attempts to use the Cicada 3301 message missing primes from 2013 as a keystream.
+        """
 
-            # Whether to add or substruct
-            for add in (False, True):
+        # Get an extended wordlist for a measurement
+        wordlist = get_rune_lexicon(True)
 
-                # Try decryption
-                pt = ProcessedText(page)
-                KeystreamTransformer(add=add, keystream=iter(secrets.MISSING_PRIMES_2013)).transform(pt)
-                if pt.get_first_non_wordlist_word_index(wordlist) >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
-                    print(f'PAGE {page_index} (IOC={pt.get_rune_ioc()}, WordMatchers={pt.get_first_non_wordlist_word_index(wordlist)}):\n{pt.to_latin()}\n\n')
+        # Sweep all pages, adding or substructing, in parallel
+        pages = get_unsolved_pages()
+        tasks = list(itertools.product(range(len(pages)), (False, True)))
+        for page_index, ioc, word_matches, latin in run_parallel_sweep(evaluate_missing_primes_2013, tasks, pages, wordlist, (word_threshold, ioc_threshold), workers=workers, chunk_size=1, desc='Missing primes 2013', checkpoint_path=CHECKPOINT_PATH_FORMAT.format('missing_primes_2013')):
+            print(f'PAGE {page_index} (IOC={ioc}, WordMatchers={word_matches}):\n{latin}\n\n')
 
     @staticmethod
-    def autokey_and_vigenere_bruteforce_with_reversing(word_threshold=6, ioc_threshold=1.8, min_key_len=6):
+    def autokey_and_vigenere_bruteforce_with_reversing(word_threshold=6, ioc_threshold=1.8, min_key_len=6, batch_size=4096, autokey_batch_size=256, workers=None):
         """
             Attempts Autokey or Vigenere bruteforcing with or without reversing the text of each page.
             Uses keys derived from all decrypted pages, with and without replacing all occurrences of first character with "F".
@@ -468,7 +624,7 @@ class Attempts(object):
         """
 
         # Get an extended wordlist for a measurement
-        wordlist = get_rune_wordlist(True)
+        wordlist = get_rune_lexicon(True)
 
         # Build potential keys
         keys = get_rune_wordlist()
@@ -476,51 +632,46 @@ class Attempts(object):
         keys += [ k.replace(k[0], RUNES[0]) for k in keys ]
         keys += rev_keys
         keys = [ k for k in keys if len(k) > min_key_len ]
-        keys = set(keys)
+        keys = sorted(set(keys))
+
+        # Attempt Vigenere on all pages and batches of keys in parallel
+        pages = get_unsolved_pages()
+        batch_starts = range(0, len(keys), batch_size)
+        tasks = list(itertools.product(range(len(pages)), batch_starts))
+        for page_index, description, latin in run_parallel_sweep(evaluate_vigenere_keys, tasks, pages, wordlist, (keys, batch_size, word_threshold, ioc_threshold), workers=workers, chunk_size=1, total=len(pages) * len(batch_starts), desc='Vigenere', checkpoint_path=CHECKPOINT_PATH_FORMAT.format('vigenere')):
+            print(f'PAGE {page_index} ({description}):\n')
+            screen.print_solved_text(f'{latin}\n\n{pages[page_index]}\n\n\n')
+
+        # Attempt Autokey on all pages and batches of keys in parallel
+        batch_starts = range(0, len(keys), autokey_batch_size)
+        tasks = list(itertools.product(range(len(pages)), batch_starts))
+        for page_index, description, latin in run_parallel_sweep(evaluate_autokey_keys, tasks, pages, wordlist, (keys, autokey_batch_size, word_threshold, ioc_threshold), workers=workers, chunk_size=1, total=len(pages) * len(batch_starts), desc='Autokey', checkpoint_path=CHECKPOINT_PATH_FORMAT.format('autokey')):
+            print(f'PAGE {page_index} ({description}):\n')
+            screen.print_solved_text(f'{latin}\n\n{pages[page_index]}\n\n\n')
 
-        # Iterate all pages
-        page_index = -1
-        for page in get_unsolved_pages():
-
-            # Increase page index
-            page_index += 1
+    @staticmethod
+    def anneal_vigenere_keys(min_key_len=1, max_key_len=15, restarts=8, interrupter_rune=RUNES[0], workers=None):
+        """
+            Attempts Vigenere with keys found by simulated annealing over quadgram scores, searching interrupters too, so keys need not be words.
+            Prints the best key found for each page and key length.
+        """
 
-            # Iterate all keys
-            for key in tqdm(keys, desc=f'Page {page_index}'):
-              
-                # Attempt Vigenere
-                pt = ProcessedText(page)
-                VigenereTransformer(key=key).transform(pt)
-                if pt.get_first_non_wordlist_word_index(wordlist) >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
-                    print(f'PAGE {page_index} (Vigenere Key={key}, IOC={pt.get_rune_ioc()}, WordMatchers={pt.get_first_non_wordlist_word_index(wordlist)}):\n')
-                    screen.print_solved_text(f'{pt.to_latin()}\n\n{page}\n\n\n')
-
-                # Iterate all modes
-                for mode in (AutokeyMode.PLAINTEXT, AutokeyMode.CIPHERTEXT, AutokeyMode.ALT_START_PLAINTEXT, AutokeyMode.ALT_START_CIPHERTEXT, AutokeyMode.ALT_MOBIUS_START_PLAINTEXT, AutokeyMode.ALT_MOBIUS_START_CIPHERTEXT):
-
-                    # Either try or do not try GP-mode
-                    for use_gp in (False, True):
-
-                        # Apply Autokey
-                        pt = ProcessedText(page)
-                        AutokeyTransformer(key=key, mode=mode, use_gp=use_gp).transform(pt)
-                        if pt.get_first_non_wordlist_word_index(wordlist) >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
-                            print(f'PAGE {page_index} (Autokey Key={key}, mode={mode}, IOC={pt.get_rune_ioc()}, WordMatchers={pt.get_first_non_wordlist_word_index(wordlist)}):\n')
-                            screen.print_solved_text(f'{pt.to_latin()}\n\n{page}\n\n\n')
-
-                        # Reverse
-                        ReverseTransformer().transform(pt)
-                        if pt.get_first_non_wordlist_word_index(wordlist) >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
-                            print(f'PAGE {page_index} (Autokey Key={key}, mode={mode}, reversed, IOC={pt.get_rune_ioc()}, WordMatchers={pt.get_first_non_wordlist_word_index(wordlist)}):\n')
-                            screen.print_solved_text(f'{pt.to_latin()}\n\n{page}\n\n\n')
-
-                        # Start from reversing and then apply Autokey
-                        pt = ProcessedText(page)
-                        ReverseTransformer().transform(pt)
-                        AutokeyTransformer(key=key, mode=mode, use_gp=use_gp).transform(pt)
-                        if pt.get_first_non_wordlist_word_index(wordlist) >= word_threshold or pt.get_rune_ioc() >= ioc_threshold:
-                            print(f'PAGE {page_index} (Reversed text Autokey Key={key}, mode={mode}, IOC={pt.get_rune_ioc()}, WordMatchers={pt.get_first_non_wordlist_word_index(wordlist)}):\n')
-                            screen.print_solved_text(f'{pt.to_latin()}\n\n{page}\n\n\n')
+        # Make sure the model is compiled, so workers can map it
+        get_quadgram_model()
+
+        # Run all restarts in parallel and keep the best result of each page and key length
+        pages = get_unsolved_pages()
+        best = {}
+        for page_index, key_length, seed, score, key, interrupt_indices in run_parallel_annealing(pages, COMPILED_QUADGRAMS_PATH, hash_files(COMPILED_QUADGRAMS_SOURCES), range(min_key_len, max_key_len + 1), restarts, interrupter_rune=interrupter_rune, workers=workers, checkpoint_path=CHECKPOINT_PATH_FORMAT.format('anneal_vigenere')):
+            if (page_index, key_length) not in best or score > best[(page_index, key_length)][0]:
+                best[(page_index, key_length)] = (score, key, interrupt_indices)
+
+        # Show the best results
+        for (page_index, key_length), (score, key, interrupt_indices) in sorted(best.items()):
+            pt = ProcessedText(pages[page_index])
+            VigenereTransformer(key, interrupt_indices).transform(pt)
+            print(f'PAGE {page_index} (Vigenere Key={key}, Score={score / max(len(pt.view_indices()), 1)}, Interrupters={sorted(interrupt_indices)}):\n')
+            screen.print_solved_text(f'{pt.to_latin()}\n\n{pages[page_index]}\n\n\n')
 
 def research_menu():
     """
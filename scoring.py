@@ -0,0 +1,236 @@
+from core import RUNES
+from core import RUNE_INDICES
+from core import ProcessedText
+from transformers import VigenereTransformer
+from transformers import get_interrupt_mask
+from ngrams import NGRAM_SIZE
+from ngrams import get_ngram_codes
+import numpy as np
+
+class WordPrefixScorer(object):
+    """
+        Counts how many words at the beginning of a page are in a lexicon, just like ProcessedText.get_first_non_wordlist_word_index.
+        Candidate decryptions are decrypted word by word and scoring stops at the first word that is not in the lexicon,
+        so rejecting a bad candidate usually costs only a few runes.
+    """
+
+    def __init__(self, processed_text, lexicon):
+        """
+            Creates an instance for the given (encrypted) processed text.
+        """
+
+        # Save the page and its word boundaries
+        self._processed_text = processed_text
+        self._indices = processed_text.view_indices().tolist()
+        self._indices_array = processed_text.view_indices().astype(np.int64)
+        self._word_spans = processed_text.get_word_spans()
+        self._lexicon = lexicon
+
+        # Key positions of each rune per interrupters set
+        self._key_positions = {}
+
+    def _count_words(self, decrypt_span, first_rune=0, end_rune=None):
+        """
+            Counts words in the lexicon until the first miss, given a function that decrypts a (start, end) span into indices.
+            Counting begins at the first word that starts at or after the given rune position, and stops at the first word that ends after the given end rune (if any).
+        """
+
+        # Decrypt one word at a time
+        word_index = -1
+        for start, end in self._word_spans:
+            if start < first_rune:
+                continue
+            word_index += 1
+            if end_rune is not None and end > end_rune:
+                return word_index
+            if not self._lexicon.contains_indices(decrypt_span(start, end)):
+                return word_index
+
+        # Indicate all words are in the lexicon by just returning the number of words
+        return word_index + 1
+
+    def _get_key_positions(self, interrupt_indices):
+        """
+            Gets the position in the keystream of each rune, or -1 for interrupters.
+        """
+
+        # Count non-interrupters
+        cache_key = frozenset(interrupt_indices)
+        if cache_key not in self._key_positions:
+            mask = get_interrupt_mask(len(self._indices), interrupt_indices)
+            self._key_positions[cache_key] = np.where(mask, np.cumsum(mask) - 1, -1).tolist()
+        return self._key_positions[cache_key]
+
+    def score_indices(self, indices):
+        """
+            Scores already decrypted indices.
+        """
+
+        # Just slice words
+        indices = np.asarray(indices).tolist()
+        return self._count_words(lambda start, end: indices[start:end])
+
+    def score_vigenere(self, key, interrupt_indices=set()):
+        """
+            Scores a Vigenere decryption with the given key (runes or indices), only decrypting the runes needed.
+        """
+
+        # Decrypt each rune of the word with the key at its key position
+        key = [ RUNE_INDICES[k] for k in key ] if isinstance(key, str) else list(key)
+        key_positions = self._get_key_positions(interrupt_indices)
+        indices = self._indices
+        return self._count_words(lambda start, end: [ indices[i] if key_positions[i] < 0 else (indices[i] - key[key_positions[i] % len(key)]) % len(RUNES) for i in range(start, end) ])
+
+    def score_keystream(self, keystream, first_rune=0):
+        """
+            Scores a decryption that substracts the given keystream from the runes starting at the given position, only decrypting the runes needed.
+            Words are counted from the first word that starts at that position, and runes beyond the keystream are not in any word.
+        """
+
+        # Substract the keystream from each word, stopping at words the keystream does not cover
+        indices = self._indices_array
+        keystream = np.asarray(keystream, dtype=np.int64)
+        return self._count_words(lambda start, end: ((indices[start:end] - keystream[start - first_rune:end - first_rune]) % len(RUNES)).tolist(), first_rune, first_rune + len(keystream))
+
+    def score_affine(self, affine):
+        """
+            Scores a decryption given as an affine map (see transformers.compose_affine), only decrypting the runes needed.
+        """
+
+        # Apply the map on each word
+        perm, mul, off = affine
+        indices = self._indices_array
+        return self._count_words(lambda start, end: ((mul[start:end] * indices[perm[start:end]] + off[start:end]) % len(RUNES)).tolist())
+
+    def score(self, transformer):
+        """
+            Scores the decryption by the given transformer, decrypting word by word whenever the transformer allows it.
+        """
+
+        # Use the cheapest available path
+        if isinstance(transformer, VigenereTransformer):
+            return self.score_vigenere(transformer.get_key_indices(), transformer.get_interrupt_indices())
+        if transformer.is_affine():
+            return self.score_affine(transformer.get_affine(len(self._indices)))
+
+        # Stateful transformers must run on the entire text
+        pt = ProcessedText.from_processed_text(self._processed_text)
+        transformer.transform(pt)
+        return self.score_indices(pt.view_indices())
+
+class VigenereEvaluation(object):
+    """
+        A Vigenere decryption of a page along with its quadgram codes and rune histogram, updated in place when a single key rune changes.
+        A key rune only decrypts every k-th rune (k being the key length), so changing it rescores only the quadgrams covering those runes.
+    """
+
+    def __init__(self, processed_text, model, key, interrupt_indices=set()):
+        """
+            Creates an instance for the given (encrypted) processed text, quadgram model and key (runes or indices).
+        """
+
+        # Decrypt entirely once
+        self._table = model.get_table()
+        self._ciphertext = processed_text.get_indices().astype(np.int64)
+        self._key = [ RUNE_INDICES[k] for k in key ] if isinstance(key, str) else list(key)
+        self._interrupt_indices = set(interrupt_indices)
+        mask = get_interrupt_mask(len(self._ciphertext), interrupt_indices)
+        slots = np.where(mask, (np.cumsum(mask) - 1) % len(self._key), -1)
+        self._plaintext = np.where(mask, (self._ciphertext - np.array(self._key, dtype=np.int64)[np.maximum(slots, 0)]) % len(RUNES), self._ciphertext)
+
+        # Keep the quadgram codes and their scores, and the rune histogram
+        self._codes = get_ngram_codes(self._plaintext)
+        self._quadgram_score = float(self._table[self._codes].sum(dtype=np.float64))
+        self._histogram = np.bincount(self._plaintext, minlength=len(RUNES))
+
+        # For each key slot, save its positions and every (quadgram, position, weight) where one of its positions is in a quadgram
+        self._slot_positions = []
+        self._slot_quadgrams = []
+        weights = len(RUNES) ** np.arange(NGRAM_SIZE - 1, -1, -1, dtype=np.int64)
+        for slot in range(len(self._key)):
+            positions = np.flatnonzero(slots == slot)
+            starts = (positions[:, None] - np.arange(NGRAM_SIZE)[None, :])
+            offsets = np.broadcast_to(np.arange(NGRAM_SIZE)[None, :], starts.shape)
+            valid = (starts >= 0) & (starts < len(self._codes))
+            unique_starts, local_starts = np.unique(starts[valid], return_inverse=True)
+            self._slot_positions.append(positions)
+            self._slot_quadgrams.append((unique_starts, local_starts, np.broadcast_to(positions[:, None], starts.shape)[valid], weights[offsets[valid]]))
+
+    def get_key(self):
+        """
+            Gets the key in runes.
+        """
+
+        # Translate
+        return ''.join([ RUNES[k] for k in self._key ])
+
+    def get_interrupt_indices(self):
+        """
+            Gets the interrupters.
+        """
+
+        # Copy
+        return set(self._interrupt_indices)
+
+    def get_indices(self):
+        """
+            Gets a copy of the decrypted indices.
+        """
+
+        # Copy
+        return self._plaintext.copy()
+
+    def get_quadgram_score(self):
+        """
+            Gets the quadgram score of the decryption.
+        """
+
+        # Kept up to date
+        return self._quadgram_score
+
+    def get_ioc(self):
+        """
+            Gets the rune IoC of the decryption.
+        """
+
+        # Calculate from the histogram
+        return ProcessedText._get_ioc_from_histogram(self._histogram, len(RUNES))
+
+    def try_key_rune(self, slot, value):
+        """
+            Evaluates changing the key rune in the given slot to the given index, without changing anything.
+            Returns the new quadgram score and a change that can be given to apply.
+        """
+
+        # Decrypt the slot runes with the new value
+        positions = self._slot_positions[slot]
+        new_plaintext = (self._ciphertext[positions] - value) % len(RUNES)
+
+        # Move the affected quadgram codes by the difference of each changed rune times its weight in the code
+        unique_starts, local_starts, pair_positions, pair_weights = self._slot_quadgrams[slot]
+        differences = (((self._ciphertext[pair_positions] - value) % len(RUNES)) - self._plaintext[pair_positions]) * pair_weights
+        new_codes = self._codes[unique_starts] + np.bincount(local_starts, weights=differences, minlength=len(unique_starts)).astype(np.int64)
+        new_score = self._quadgram_score + float(self._table[new_codes].sum(dtype=np.float64) - self._table[self._codes[unique_starts]].sum(dtype=np.float64))
+        return new_score, (slot, value, new_plaintext, new_codes)
+
+    def apply(self, new_score, change):
+        """
+            Applies a change returned by try_key_rune.
+        """
+
+        # Update the histogram, decryption, codes and key
+        slot, value, new_plaintext, new_codes = change
+        positions = self._slot_positions[slot]
+        self._histogram += np.bincount(new_plaintext, minlength=len(RUNES)) - np.bincount(self._plaintext[positions], minlength=len(RUNES))
+        self._plaintext[positions] = new_plaintext
+        self._codes[self._slot_quadgrams[slot][0]] = new_codes
+        self._quadgram_score = new_score
+        self._key[slot] = value
+
+    def set_key_rune(self, slot, value):
+        """
+            Changes the key rune in the given slot to the given index.
+        """
+
+        # Evaluate and apply
+        self.apply(*self.try_key_rune(slot, value))
@@ -0,0 +1,136 @@
+from core import RUNES
+from core import ProcessedText
+from pages import PAGES
+import numpy as np
+
+# Number of possible bigrams
+BIGRAM_COUNT = len(RUNES) ** 2
+
+def _flatten_texts(texts):
+    """
+        Flattens texts of Gematria indices (either an N by L matrix or a list of arrays of any length) to a single array.
+        Returns the flattened indices, the text of each index, the position of each index within its text and the length of each text.
+    """
+
+    # Matrices are flattened as they are
+    if isinstance(texts, np.ndarray) and texts.ndim == 2:
+        rows, length = texts.shape
+        flat = texts.astype(np.int64).ravel()
+        text_ids = np.repeat(np.arange(rows), length)
+        positions = np.tile(np.arange(length), rows)
+        return flat, text_ids, positions, np.full(rows, length, dtype=np.int64)
+
+    # Concatenate texts of different lengths
+    lengths = np.array([ len(text) for text in texts ], dtype=np.int64)
+    flat = np.concatenate([ np.asarray(text, dtype=np.int64) for text in texts ]) if len(texts) > 0 else np.zeros(0, dtype=np.int64)
+    text_ids = np.repeat(np.arange(len(texts)), lengths)
+    positions = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return flat, text_ids, positions, lengths
+
+def _get_bigrams(texts):
+    """
+        Gets all bigrams (as first * 29 + second) of the given texts along with the text of each bigram.
+    """
+
+    # Only take pairs that do not cross from one text to the next
+    flat, text_ids, positions, lengths = _flatten_texts(texts)
+    same_text = text_ids[1:] == text_ids[:-1]
+    return (flat[:-1] * len(RUNES) + flat[1:])[same_text], text_ids[1:][same_text], len(lengths)
+
+def _get_ioc_from_counts(counts, alphabet_size):
+    """
+        Calculates the IoC along the last axis of the given counts, or zero where there are less than two letters.
+    """
+
+    # Normalize by the expected value of a uniformly random text
+    totals = counts.sum(axis=-1)
+    expected = totals * (totals - 1) / alphabet_size
+    return np.divide((counts * (counts - 1)).sum(axis=-1), expected, out=np.zeros(expected.shape), where=totals > 1)
+
+def get_bigram_counts(texts):
+    """
+        Gets the 29 by 29 bigram count matrix of each of the given texts, as an N by 29 by 29 array.
+    """
+
+    # Count all bigrams of all texts at once by giving each text its own range of bins
+    bigrams, text_ids, text_count = _get_bigrams(texts)
+    counts = np.bincount(text_ids * BIGRAM_COUNT + bigrams, minlength=text_count * BIGRAM_COUNT)
+    return counts.reshape(text_count, len(RUNES), len(RUNES))
+
+def get_bigram_ioc(texts):
+    """
+        Gets the bigram IoC of each of the given texts, normalized so a uniformly random text scores 1.
+    """
+
+    # Texts of different lengths are calculated from the flattened bigram counts
+    if not (isinstance(texts, np.ndarray) and texts.ndim == 2):
+        counts = get_bigram_counts(texts)
+        return _get_ioc_from_counts(counts.reshape(len(counts), BIGRAM_COUNT), BIGRAM_COUNT)
+
+    # Matrices of candidates are sorted per row instead of counted, so memory does not grow with the number of possible bigrams
+    rows, length = texts.shape
+    if length < 3:
+        return np.zeros(rows)
+    bigrams = np.sort(texts[:, :-1].astype(np.int64) * len(RUNES) + texts[:, 1:], axis=1)
+
+    # Each bigram equals all bigrams before it in its run of equal bigrams, and every equal pair is counted twice in the sum of c * (c - 1)
+    positions = np.arange(length - 1)
+    run_starts = np.where(np.concatenate([ np.ones((rows, 1), dtype=bool), bigrams[:, 1:] != bigrams[:, :-1] ], axis=1), positions, 0)
+    equal_pairs = 2 * (positions - np.maximum.accumulate(run_starts, axis=1)).sum(axis=1)
+    return equal_pairs / ((length - 1) * (length - 2) / BIGRAM_COUNT)
+
+def get_doublet_rate(texts):
+    """
+        Gets the rate of doublets (the same rune twice in a row) among the bigrams of each of the given texts.
+        A uniformly random text has a rate of about 1/29.
+    """
+
+    # Matrices of candidates are compared directly
+    if isinstance(texts, np.ndarray) and texts.ndim == 2:
+        if texts.shape[1] < 2:
+            return np.zeros(len(texts))
+        return (texts[:, 1:] == texts[:, :-1]).mean(axis=1)
+
+    # Count doublets (which are exactly the bigrams divisible by 30, as a * 29 + a = a * 30) and bigrams per text
+    bigrams, text_ids, text_count = _get_bigrams(texts)
+    doublets = np.bincount(text_ids, weights=(bigrams % (len(RUNES) + 1) == 0), minlength=text_count)
+    totals = np.bincount(text_ids, minlength=text_count)
+    return np.divide(doublets, totals, out=np.zeros(text_count), where=totals > 0)
+
+def get_periodic_ioc(texts, periods=range(1, 30)):
+    """
+        Gets the periodic IoC of each of the given texts for each of the given periods, as an N by P array.
+        For each period the text is split to columns (every period-th rune) and the IoC of the columns is averaged.
+    """
+
+    # Count each column of each text at once
+    flat, text_ids, positions, lengths = _flatten_texts(texts)
+    result = np.zeros((len(lengths), len(periods)))
+    for period_index, period in enumerate(periods):
+        bins = (text_ids * period + positions % period) * len(RUNES) + flat
+        counts = np.bincount(bins, minlength=len(lengths) * period * len(RUNES)).reshape(len(lengths), period, len(RUNES))
+
+        # Average the IoC of columns that have enough runes to have any pairs
+        column_iocs = _get_ioc_from_counts(counts, len(RUNES))
+        valid_columns = (counts.sum(axis=-1) > 1).sum(axis=-1)
+        result[:, period_index] = np.divide(column_iocs.sum(axis=-1), valid_columns, out=np.zeros(len(lengths)), where=valid_columns > 0)
+
+    # Return all results
+    return result
+
+def get_pages_statistics(periods=range(1, 30)):
+    """
+        Computes digraph statistics of the (encrypted) runes of all pages at once.
+        Returns a dictionary of arrays, where the first axis is the page index in PAGES.
+    """
+
+    # Take the indices of all pages
+    texts = [ ProcessedText(page[0]).view_indices() for page in PAGES ]
+
+    # Compute everything in bulk
+    return {
+        'bigram_counts' : get_bigram_counts(texts),
+        'bigram_ioc' : get_bigram_ioc(texts),
+        'doublet_rate' : get_doublet_rate(texts),
+        'periodic_ioc' : get_periodic_ioc(texts, periods)
+    }
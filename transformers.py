@@ -1,13 +1,202 @@
 from core import RUNES
+from core import RUNE_INDICES
+from core import GP_PRIMES
 from abc import ABC
 from abc import abstractmethod
 import sympy
+import itertools
+import numpy as np
+import keystreams
+import hashlib
+from collections import OrderedDict
 from enum import Enum
 from core import ProcessedText
+from numtheory import get_tables
+from numtheory import MAX_BOUND
 
 # Autokey modes
 AutokeyMode = Enum('AutokeyMode', [ 'PLAINTEXT', 'CIPHERTEXT', 'ALT_START_PLAINTEXT', 'ALT_START_CIPHERTEXT', 'ALT_MOBIUS_START_PLAINTEXT', 'ALT_MOBIUS_START_CIPHERTEXT' ])
 
+# Whether transformers that support it use the vectorized execution path, unless overridden per transformer
+VECTORIZED_BY_DEFAULT = True
+
+def set_vectorized_by_default(vectorized):
+    """
+        Globally selects between the vectorized and the rune-by-rune execution paths.
+    """
+
+    # Save globally
+    global VECTORIZED_BY_DEFAULT
+    VECTORIZED_BY_DEFAULT = vectorized
+
+# Maximum memory held by cached intermediate results of transformer sequences, in bytes, once enabled
+MAX_PREFIX_CACHE_BYTES = 64 * 1024 * 1024
+
+class PrefixCache(object):
+    """
+        A content-addressed cache of intermediate results of transformer sequences, keyed by a digest of the input indices and the signatures of the transformers applied.
+        Entries are read-only index arrays, evicted in least recently used order once they take more than the memory bound.
+    """
+
+    def __init__(self, max_bytes=MAX_PREFIX_CACHE_BYTES):
+        """
+            Creates an instance.
+        """
+
+        # Entries in least recently used order, along with counters
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._max_bytes = max_bytes
+        self._hits = 0
+        self._misses = 0
+
+    def set_max_bytes(self, max_bytes):
+        """
+            Sets the memory bound, where zero disables the cache.
+        """
+
+        # Evict whatever no longer fits
+        self._max_bytes = max_bytes
+        self._evict()
+
+    def is_enabled(self):
+        """
+            Indicates whether the cache holds anything at all.
+        """
+
+        # Disabled by a zero bound
+        return self._max_bytes > 0
+
+    def _evict(self):
+        """
+            Evicts least recently used entries until the cache fits its memory bound.
+        """
+
+        # Pop from the least recently used end
+        while self._bytes > self._max_bytes and len(self._entries) > 0:
+            self._bytes -= self._entries.popitem(last=False)[1].nbytes
+
+    def find(self, digest, prefixes):
+        """
+            Finds the first of the given prefix signatures that is cached for the given input digest, counting a single hit or miss.
+            Returns the index of the prefix and its cached indices, or None and None.
+        """
+
+        # Probe in order
+        for prefix_index, prefix in enumerate(prefixes):
+            key = (digest, prefix)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return prefix_index, self._entries[key]
+        self._misses += 1
+        return None, None
+
+    def put(self, digest, prefix, indices):
+        """
+            Caches the read-only indices output by the given prefix signature for the given input digest.
+        """
+
+        # Replace any older entry and keep within the bound
+        key = (digest, prefix)
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key).nbytes
+        self._entries[key] = indices
+        self._bytes += indices.nbytes
+        self._evict()
+
+    def clear(self):
+        """
+            Removes all entries and resets the counters.
+        """
+
+        # Start over
+        self._entries.clear()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get_stats(self):
+        """
+            Gets the counters and the current size of the cache.
+        """
+
+        # Return as a dictionary
+        return {
+            'hits' : self._hits,
+            'misses' : self._misses,
+            'entries' : len(self._entries),
+            'bytes' : self._bytes
+        }
+
+# Intermediate results of transformer sequences, shared by the entire process
+# Disabled by default, as one-off transforms only pay for digests and copies; sweeps that run the same prefixes on the same text enable it
+_PREFIX_CACHE = PrefixCache(0)
+
+def get_prefix_cache():
+    """
+        Gets the cache of intermediate results shared by all transformer sequences.
+    """
+
+    # Return the global instance
+    return _PREFIX_CACHE
+
+def get_text_digest(indices):
+    """
+        Gets a digest of the given indices, which identifies a text by its content.
+    """
+
+    # Hash the raw bytes
+    return hashlib.blake2b(np.ascontiguousarray(indices, dtype=np.uint8).tobytes(), digest_size=16).digest()
+
+def get_interrupt_mask(length, interrupt_indices):
+    """
+        Gets a boolean mask of all positions that are not interrupters.
+    """
+
+    # Mark interrupters that fall within the text
+    mask = np.ones(length, dtype=bool)
+    mask[[ i for i in interrupt_indices if 0 <= i < length ]] = False
+    return mask
+
+def add_keystream(indices, mask, keystream):
+    """
+        Adds the keystream to all masked indices in a single array operation.
+    """
+
+    # Work on wide integers to avoid wrapping around in uint8
+    result = indices.astype(np.int64)
+    result[mask] += keystream
+    return result % len(RUNES)
+
+def get_identity_affine(length):
+    """
+        Gets the affine map that keeps indices as they are.
+    """
+
+    # Keep every position and value
+    return np.arange(length), np.ones(length, dtype=np.int64), np.zeros(length, dtype=np.int64)
+
+def compose_affine(first, second):
+    """
+        Composes two affine maps, the first one being applied first.
+        An affine map is a (permutation, multipliers, offsets) tuple, mapping indices to (multipliers * indices[permutation] + offsets) % 29.
+    """
+
+    # Substitute the first map into the second one
+    first_perm, first_mul, first_off = first
+    second_perm, second_mul, second_off = second
+    return first_perm[second_perm], (second_mul * first_mul[second_perm]) % len(RUNES), (second_mul * first_off[second_perm] + second_off) % len(RUNES)
+
+def apply_affine(indices, affine):
+    """
+        Applies an affine map on indices in a single pass.
+    """
+
+    # Gather, multiply and offset at once
+    perm, mul, off = affine
+    return (mul * indices.astype(np.int64)[perm] + off) % len(RUNES)
+
 class MathUtils(object):
     """
         Math utilities.
@@ -19,13 +208,10 @@ class MathUtils(object):
             Finds the next prime number.
         """
 
-        # Just iterate
-        if prev_prime == 2:
-            return 3
-        candidate = prev_prime + 2
-        while not sympy.isprime(candidate):
-            candidate += 2
-        return candidate
+        # Use the sieved tables unless the prime is too big for them
+        if prev_prime < MAX_BOUND // 2:
+            return get_tables().next_prime(prev_prime)
+        return int(sympy.nextprime(prev_prime))
 
     @staticmethod
     def mobius(n):
@@ -33,8 +219,10 @@ class MathUtils(object):
             Defines Mobius function.
         """
 
-        # Use sympy
-        return sympy.mobius(n)
+        # Use the sieved tables unless the number is too big for them
+        if n <= MAX_BOUND:
+            return int(get_tables().get_mobius([ n ])[0])
+        return int(sympy.mobius(n))
 
     @staticmethod
     def totient(n):
@@ -42,8 +230,10 @@ class MathUtils(object):
             Defines the Totient function.
         """
 
-        # Use sympy
-        return sympy.totient(n)
+        # Use the sieved tables unless the number is too big for them
+        if n <= MAX_BOUND:
+            return int(get_tables().get_totients([ n ])[0])
+        return int(sympy.totient(n))
 
 class TransformerBase(ABC):
     """
@@ -57,39 +247,167 @@ class TransformerBase(ABC):
         """
         pass
 
+    def is_vectorized(self):
+        """
+            Indicates whether to use the vectorized execution path.
+        """
+
+        # Per-transformer choice overrides the global one
+        vectorized = getattr(self, '_vectorized', None)
+        return VECTORIZED_BY_DEFAULT if vectorized is None else vectorized
+
+    def is_affine(self):
+        """
+            Indicates whether the transformer is an affine map on indices that only depends on the text length.
+        """
+
+        # Not affine unless stated otherwise
+        return False
+
+    def get_affine(self, length):
+        """
+            Gets the transformer as an affine map (see compose_affine) for a text of the given length.
+        """
+
+        # Only supported by affine transformers
+        raise NotImplementedError(f'{self.__class__.__name__} is not affine')
+
+    def get_rune_map(self):
+        """
+            Gets the permutation of the alphabet the transformer applies to every rune (new index by old index), or None if there is none.
+            Transformers with a rune map keep the rune histogram (and therefore the IoC) up to a permutation.
+        """
+
+        # No permutation unless stated otherwise
+        return None
+
+    def signature(self):
+        """
+            Gets a hashable description of the transformer and all of its parameters, so equal signatures transform equal texts equally.
+            Transformers that have none (e.g. ones that consume iterators) are never cached.
+        """
+
+        # No signature unless stated otherwise
+        return None
+
 class ShiftTransformer(TransformerBase):
     """
         Shift (Caesar) transformer.
     """
 
-    def __init__(self, shift):
+    def __init__(self, shift, vectorized=None):
         """
             Creates an instance.
         """
 
         # Saves the shift value
         self._shift = shift % len(RUNES)
+        self._vectorized = vectorized
 
     def transform(self, processed_text):
         """
             Trandforms runes.
         """
 
+        # Performs the shift transformation as a single array operation
+        if self.is_vectorized():
+            processed_text.set_indices((processed_text.view_indices().astype(np.int64) + self._shift) % len(RUNES), self.get_rune_map())
+            return
+
         # Performs the shift transformation
-        processed_text.set_runes([ RUNES[(RUNES.index(rune) + self._shift) % len(RUNES)] for rune in processed_text.get_runes() ])
+        processed_text.set_indices([ (index + self._shift) % len(RUNES) for index in processed_text.view_indices().tolist() ], self.get_rune_map())
+
+    def is_affine(self):
+        """
+            Indicates the transformer is affine.
+        """
+
+        # Always affine
+        return True
+
+    def get_affine(self, length):
+        """
+            Gets the transformer as an affine map.
+        """
+
+        # Offset all indices
+        perm, mul, off = get_identity_affine(length)
+        return perm, mul, off + self._shift
+
+    def get_rune_map(self):
+        """
+            Gets the permutation of the alphabet.
+        """
+
+        # Rotate the alphabet
+        return (np.arange(len(RUNES)) + self._shift) % len(RUNES)
+
+    def signature(self):
+        """
+            Gets the signature.
+        """
+
+        # The shift is the only parameter
+        return ('Shift', self._shift)
 
 class AtbashTransformer(TransformerBase):
     """
         Atbash transformer.
     """
 
+    def __init__(self, vectorized=None):
+        """
+            Creates an instance.
+        """
+
+        # Save the execution path
+        self._vectorized = vectorized
+
     def transform(self, processed_text):
         """
             Transforms runes.
         """
 
+        # Performs Atbash transformation as a single array operation
+        if self.is_vectorized():
+            processed_text.set_indices(len(RUNES) - 1 - processed_text.view_indices().astype(np.int64), self.get_rune_map())
+            return
+
         # Performs Atbash transformation
-        processed_text.set_runes([ RUNES[len(RUNES) - RUNES.index(rune) - 1] for rune in processed_text.get_runes() ])
+        processed_text.set_indices([ len(RUNES) - index - 1 for index in processed_text.view_indices().tolist() ], self.get_rune_map())
+
+    def is_affine(self):
+        """
+            Indicates the transformer is affine.
+        """
+
+        # Always affine
+        return True
+
+    def get_affine(self, length):
+        """
+            Gets the transformer as an affine map.
+        """
+
+        # Negate all indices
+        perm, mul, off = get_identity_affine(length)
+        return perm, -mul, off + len(RUNES) - 1
+
+    def get_rune_map(self):
+        """
+            Gets the permutation of the alphabet.
+        """
+
+        # Flip the alphabet
+        return len(RUNES) - 1 - np.arange(len(RUNES))
+
+    def signature(self):
+        """
+            Gets the signature.
+        """
+
+        # No parameters
+        return ('Atbash',)
 
 class AutokeyTransformer(TransformerBase):
     """
@@ -106,14 +424,14 @@ class AutokeyTransformer(TransformerBase):
 
         # Save the key indices
         assert len(key) > 0, Exception('Empty key')
-        self._key_indices = [ RUNES.index(rune) for rune in key ]
+        self._key_indices = [ RUNE_INDICES[rune] for rune in key ]
 
         # Save the interrupters
         self._interrupt_indices = interrupt_indices
 
         # Save the mode
         self._mode = mode
-        self._use_gp = False
+        self._use_gp = use_gp
 
     def transform(self, processed_text):
         """
@@ -130,27 +448,28 @@ class AutokeyTransformer(TransformerBase):
         ciphertext_extension_index = 0
         mob_value = None
         running_key_indices = self._key_indices[:]
-        ciphertext = processed_text.get_runes()
-        for rune in ciphertext:
+        ciphertext = processed_text.view_indices().tolist()
+        mob_values = get_tables().get_mobius(range(1, len(ciphertext) + 1)).tolist()
+        for index in ciphertext:
             rune_index += 1
 
             # Handle Mobius function and change state accrdingly
             if self._mode in (AutokeyMode.ALT_MOBIUS_START_PLAINTEXT, AutokeyMode.ALT_MOBIUS_START_CIPHERTEXT):
-                mob_value = MathUtils.mobius(rune_index + 1)
-                extend_to_plaintext = (AutokeyMode.ALT_MOBIUS_START_PLAINTEXT and mob_value == 1) or (AutokeyMode.ALT_MOBIUS_START_CIPHERTEXT and mob_value == 0)
+                mob_value = mob_values[rune_index]
+                extend_to_plaintext = mob_value == (1 if self._mode == AutokeyMode.ALT_MOBIUS_START_PLAINTEXT else -1)
 
             # Treat mobius value of 0 just like an interrupt index
             if rune_index in self._interrupt_indices or mob_value == 0:
-                new_index = RUNES.index(rune)
+                new_index = index
             else:
-                new_index = (RUNES.index(rune) - running_key_indices[key_index]) % len(RUNES)
+                new_index = (index - running_key_indices[key_index]) % len(RUNES)
                 key_index += 1
 
                 # Extend the keystream from either plaintext or ciphertext
                 if extend_to_plaintext:
                     running_key_indices.append(new_index)
                 else:
-                    running_key_indices.append(RUNES.index(ciphertext[ciphertext_extension_index]))
+                    running_key_indices.append(ciphertext[ciphertext_extension_index])
                     ciphertext_extension_index += 1
 
                 # Using GP mode we extend the running keystream with the GP value of the lastly added value
@@ -162,10 +481,18 @@ class AutokeyTransformer(TransformerBase):
                     extend_to_plaintext = not extend_to_plaintext
 
             # Add the new rune
-            result.append(RUNES[new_index])
+            result.append(new_index)
 
         # Set the result
-        processed_text.set_runes(result)
+        processed_text.set_indices(result)
+
+    def signature(self):
+        """
+            Gets the signature.
+        """
+
+        # Key, mode, GP-mode and interrupters
+        return ('Autokey', tuple(self._key_indices), self._mode.name, bool(self._use_gp), frozenset(self._interrupt_indices))
 
 class AutokeyMobiusTransformer(TransformerBase):
 
@@ -189,15 +516,17 @@ class AutokeyMobiusTransformer(TransformerBase):
 
         # Split by runes
         rune_chunks = [ '' ] * 3
-        interrupt_indices = [ set() ] * 3
+        interrupt_indices = [ set() for i in range(3) ]
         rune_index = 0
-        for rune in processed_text.get_runes():
+        runes = processed_text.view_runes()
+        mob_values = get_tables().get_mobius(range(1, len(runes) + 1)).tolist()
+        for rune in runes:
             
             # Use 1-based indexing
             rune_index += 1
 
             # Append to the right ciphertext chunk and map Mobius function from { -1, 0, 1 } to { 0, 1, 2 }
-            fixed_index = MathUtils.mobius(rune_index) + 1
+            fixed_index = mob_values[rune_index - 1] + 1
             rune_chunks[fixed_index] += rune
 
             # Save interrupt indices
@@ -207,247 +536,298 @@ class AutokeyMobiusTransformer(TransformerBase):
         # Run each transformer seperately
         pt_chunks = [ None ] * 3
         for i in range(3):
-            transformer = AutokeyTransformer(self._keys[i], self._mode, interrupt_indices[i])
+            transformer = AutokeyTransformer(self._keys[i], self._mode, interrupt_indices=interrupt_indices[i])
             pt_chunks[i] = ProcessedText(rune_chunks[i])
             transformer.transform(pt_chunks[i])
 
         # Merge results
         results = []
-        pt_runes = [ pt.get_runes() for pt in pt_chunks ]
-        rune_index = 0
-        for rune in processed_text.get_runes():
-            rune_index += 1
-            fixed_index = MathUtils.mobius(rune_index) + 1
-            results.append(pt_runes[fixed_index].pop(0)) 
-        processed_text.set_runes(results)
+        pt_indices = [ iter(pt.view_indices().tolist()) for pt in pt_chunks ]
+        for mob_value in mob_values:
+            results.append(next(pt_indices[mob_value + 1]))
+        processed_text.set_indices(results)
+
+    def signature(self):
+        """
+            Gets the signature.
+        """
+
+        # Keys, mode and interrupters
+        return ('AutokeyMobius', tuple(self._keys), self._mode.name, frozenset(self._interrupt_indices))
 
 class VigenereTransformer(TransformerBase):
     """
         Vigenere cipher decryption.
     """
 
-    def __init__(self, key, interrupt_indices=set()):
+    def __init__(self, key, interrupt_indices=set(), vectorized=None):
         """
             Creates an instance.
         """
 
         # Save the key indices
         assert len(key) > 0, Exception('Empty key')
-        self._key_indices = [ RUNES.index(rune) for rune in key ]
+        self._key_indices = [ RUNE_INDICES[rune] for rune in key ]
         assert len([ i for i in self._key_indices if i < 0 ]) == 0, Exception('Invalid key')
 
-        # Save the interrupters
+        # Save the interrupters and the execution path
         self._interrupt_indices = interrupt_indices
+        self._vectorized = vectorized
+
+    def get_key_indices(self):
+        """
+            Gets the key indices.
+        """
+
+        # Copy the key
+        return self._key_indices[:]
+
+    def get_interrupt_indices(self):
+        """
+            Gets the interrupters.
+        """
+
+        # Return the interrupters
+        return self._interrupt_indices
 
     def transform(self, processed_text):
         """
             transforms runes.
         """
 
+        # Substract the tiled key from all non-interrupters at once
+        if self.is_vectorized():
+            indices = processed_text.view_indices()
+            mask = get_interrupt_mask(len(indices), self._interrupt_indices)
+            processed_text.set_indices(add_keystream(indices, mask, -np.resize(np.array(self._key_indices, dtype=np.int64), mask.sum())))
+            return
+
         # Performs Vigenere decryption
         result = []
         key_index = 0
         rune_index = -1
-        for rune in processed_text.get_runes():
+        for index in processed_text.view_indices().tolist():
             rune_index += 1
             if rune_index in self._interrupt_indices:
-                new_index = RUNES.index(rune)
+                new_index = index
             else:
-                new_index = (RUNES.index(rune) - self._key_indices[key_index]) % len(RUNES)
+                new_index = (index - self._key_indices[key_index]) % len(RUNES)
                 key_index = (key_index + 1) % len(self._key_indices)
-            result.append(RUNES[new_index])
+            result.append(new_index)
 
         # Set the result
-        processed_text.set_runes(result)
+        processed_text.set_indices(result)
 
-class TotientPrimeTransformer(TransformerBase):
-    """
-        Substructs or adds the totient of primes (i.e. p-1) from each index.
-        You can also call the totient function recusrively, if needed, or not call it at all.
-    """
+    def is_affine(self):
+        """
+            Indicates the transformer is affine.
+        """
+
+        # Always affine
+        return True
 
-    def __init__(self, add=True, interrupt_indices=set(), tot_calls=1):
+    def get_affine(self, length):
         """
-            Creates an instance.
+            Gets the transformer as an affine map.
         """
 
-        # Save the action and the number of totient calls
-        self._add = add
-        self._tot_calls = tot_calls
+        # Offset all non-interrupters by the tiled key
+        perm, mul, off = get_identity_affine(length)
+        mask = get_interrupt_mask(length, self._interrupt_indices)
+        off[mask] = -np.resize(np.array(self._key_indices, dtype=np.int64), mask.sum()) % len(RUNES)
+        return perm, mul, off
 
-        # Save the interrupters
-        self._interrupt_indices = interrupt_indices
+    def signature(self):
+        """
+            Gets the signature.
+        """
+
+        # Key and interrupters
+        return ('Vigenere', tuple(self._key_indices), frozenset(self._interrupt_indices))
+
+class ReverseTransformer(TransformerBase):
+    """
+        Reverses the processed text.
+    """
 
     def transform(self, processed_text):
         """
             Transforms runes.
         """
 
-        # Substract or adds the totient of each prime
-        result = []
-        curr_prime = 2
-        rune_index = -1
-        for rune in processed_text.get_runes():
-            rune_index += 1
-            if rune_index in self._interrupt_indices:
-                new_index = RUNES.index(rune)
-            else:
-                val = curr_prime
-                for i in range(self._tot_calls):
-                    val = MathUtils.totient(val)
-                if not self._add:
-                    val *= -1
-                new_index = (RUNES.index(rune) + val) % len(RUNES)
-                curr_prime = MathUtils.find_next_prime(curr_prime)
-            result.append(RUNES[new_index])
+        # Reverses runes
+        processed_text.set_indices(processed_text.view_indices()[::-1], self.get_rune_map())
 
-        # Set the result
-        processed_text.set_runes(result)
+    def is_affine(self):
+        """
+            Indicates the transformer is affine.
+        """
 
-class TotientFibTransformer(TransformerBase):
-    """
-        Substructs or adds the totient of the Fibonacci sequence from each index.
-        You can also call the totient function recusrively, if needed, or not call it at all.
-    """
+        # Always affine
+        return True
 
-    def __init__(self, add=True, interrupt_indices=set(), tot_calls=1):
+    def get_affine(self, length):
         """
-            Creates an instance.
+            Gets the transformer as an affine map.
         """
 
-        # Save the action and the number of totient calls
-        self._add = add
-        self._tot_calls = tot_calls
+        # Reverse positions
+        perm, mul, off = get_identity_affine(length)
+        return perm[::-1].copy(), mul, off
 
-        # Save the interrupters
-        self._interrupt_indices = interrupt_indices
-
-    def transform(self, processed_text):
+    def get_rune_map(self):
         """
-            Transforms runes.
+            Gets the permutation of the alphabet.
         """
 
-        # Substract or adds the totient of each element in the Fibonacci sequence 
-        result = []
-        fib_a, fib_b = 1, 1
-        rune_index = -1
-        for rune in processed_text.get_runes():
-            rune_index += 1
-            if rune_index in self._interrupt_indices:
-                new_index = RUNES.index(rune)
-            else:
-                val = fib_a
-                for i in range(self._tot_calls):
-                    val = MathUtils.totient(val)
-                if not self._add:
-                    val *= -1
-                new_index = (RUNES.index(rune) + val) % len(RUNES)
-                fib_a, fib_b = fib_b, fib_a + fib_b
-                print(f'! {fib_a} !')
-            result.append(RUNES[new_index])
+        # Runes only move around
+        return np.arange(len(RUNES))
 
-        # Set the result
-        processed_text.set_runes(result)
+    def signature(self):
+        """
+            Gets the signature.
+        """
+
+        # No parameters
+        return ('Reverse',)
 
-class MobiusTotientPrimeTransformer(TransformerBase):
+class KeystreamTransformer(TransformerBase):
     """
-        Substructs or adds to Mobius function of the totient of primes (i.e. p-1), times a either the totient or the prime, from each index.
+        Uses a keystream to either add or substruct from each rune value.
+        The keystream is either an iterator or the name of a registered keystream (see keystreams.py), with its parameters.
+        Keystream is assumed to be infinite or sufficiently long, otherwise the text is kept as-is.
     """
 
-    def __init__(self, add=True, use_prime_as_base=False, interrupt_indices=set()):
+    def __init__(self, add=True, keystream=None, interrupt_indices=set(), vectorized=None, **keystream_params):
         """
             Creates an instance.
         """
 
-        # Save the action
+        # Save the keystream and the action
+        self._keystream = keystream
+        self._keystream_params = keystream_params
         self._add = add
-        self._use_prime_as_base = use_prime_as_base
 
-        # Save the interrupters
+        # Save the interrupters and the execution path
         self._interrupt_indices = interrupt_indices
+        self._vectorized = vectorized
+
+    def get_keystream(self, length):
+        """
+            Gets the signed keystream for the given number of non-interrupters, which might be shorter for finite keystreams.
+        """
+
+        # Registered keystreams are cached, iterators are consumed
+        if isinstance(self._keystream, str):
+            result = keystreams.get_keystream(self._keystream, length, **self._keystream_params)
+        else:
+            result = np.array([ int(val) % len(RUNES) for val in itertools.islice(self._keystream, length) ], dtype=np.int64)
+        return result if self._add else -result
 
     def transform(self, processed_text):
         """
             Transforms runes.
         """
 
-        # Substract or adds the value of each prime
+        # Take the entire keystream in advance, keeping the text as-is if the keystream is too short
+        indices = processed_text.view_indices()
+        mask = get_interrupt_mask(len(indices), self._interrupt_indices)
+        keystream = self.get_keystream(int(mask.sum()))
+        if len(keystream) < mask.sum():
+            return
+
+        # Run the keystream at once
+        if self.is_vectorized():
+            processed_text.set_indices(add_keystream(indices, mask, keystream))
+            return
+
+        # Runs the keystream
         result = []
-        curr_prime = 2
         rune_index = -1
-        for rune in processed_text.get_runes():
+        key_index = 0
+        for index in indices.tolist():
             rune_index += 1
             if rune_index in self._interrupt_indices:
-                new_index = RUNES.index(rune)
+                result.append(index)
             else:
-                tot = MathUtils.totient(curr_prime)
-                if self._use_prime_as_base:
-                    val = (MathUtils.mobius(tot) * curr_prime) % len(RUNES)
-                else:
-                    val = (MathUtils.mobius(tot) * tot) % len(RUNES)
-                if not self._add:
-                    val *= -1
-                new_index = (RUNES.index(rune) + val) % len(RUNES)
-                curr_prime = MathUtils.find_next_prime(curr_prime)
-            result.append(RUNES[new_index])
+                result.append((index + int(keystream[key_index])) % len(RUNES))
+                key_index += 1
 
         # Set the result
-        processed_text.set_runes(result)
+        processed_text.set_indices(result)
 
-class ReverseTransformer(TransformerBase):
+    def is_affine(self):
+        """
+            Indicates whether the transformer is affine, which is only the case for registered keystreams (iterators are consumed).
+        """
+
+        # Only registered keystreams
+        return isinstance(self._keystream, str)
+
+    def get_affine(self, length):
+        """
+            Gets the transformer as an affine map.
+        """
+
+        # Offset all non-interrupters by the keystream, unless it is too short
+        assert self.is_affine(), Exception('Iterator keystreams are not affine')
+        perm, mul, off = get_identity_affine(length)
+        mask = get_interrupt_mask(length, self._interrupt_indices)
+        keystream = self.get_keystream(int(mask.sum()))
+        if len(keystream) == mask.sum():
+            off[mask] = keystream % len(RUNES)
+        return perm, mul, off
+
+    def signature(self):
+        """
+            Gets the signature, which only registered keystreams have (iterators are consumed).
+        """
+
+        # Keystream name and parameters, action and interrupters
+        if not isinstance(self._keystream, str):
+            return None
+        return ('Keystream', self._keystream, tuple(sorted(self._keystream_params.items())), bool(self._add), frozenset(self._interrupt_indices))
+
+class TotientPrimeTransformer(KeystreamTransformer):
     """
-        Reverses the processed text.
+        Substructs or adds the totient of primes (i.e. p-1) from each index.
+        You can also call the totient function recusrively, if needed, or not call it at all.
     """
 
-    def transform(self, processed_text):
+    def __init__(self, add=True, interrupt_indices=set(), tot_calls=1, vectorized=None):
         """
-            Transforms runes.
+            Creates an instance.
         """
 
-        # Reverses runes
-        processed_text.set_runes(processed_text.get_runes()[::-1])
+        # Use the registered keystream
+        super().__init__(add=add, keystream='totient_primes', interrupt_indices=interrupt_indices, vectorized=vectorized, tot_calls=tot_calls)
 
-class KeystreamTransformer(TransformerBase):
+class TotientFibTransformer(KeystreamTransformer):
     """
-        Uses a keystream to either add or substruct from each rune value.
-        Keystream is assumed to be infinite or sufficiently long.
+        Substructs or adds the totient of the Fibonacci sequence from each index.
+        You can also call the totient function recusrively, if needed, or not call it at all.
     """
 
-    def __init__(self, add=True, keystream=None, interrupt_indices=set()):
+    def __init__(self, add=True, interrupt_indices=set(), tot_calls=1, vectorized=None):
         """
             Creates an instance.
         """
 
-        # Save the keystream and the action
-        self._keystream = keystream
-        self._add = add
+        # Use the registered keystream
+        super().__init__(add=add, keystream='totient_fibonacci', interrupt_indices=interrupt_indices, vectorized=vectorized, tot_calls=tot_calls)
 
-        # Save the interrupters
-        self._interrupt_indices = interrupt_indices
+class MobiusTotientPrimeTransformer(KeystreamTransformer):
+    """
+        Substructs or adds to Mobius function of the totient of primes (i.e. p-1), times a either the totient or the prime, from each index.
+    """
 
-    def transform(self, processed_text):
+    def __init__(self, add=True, use_prime_as_base=False, interrupt_indices=set(), vectorized=None):
         """
-            Transforms runes.
+            Creates an instance.
         """
 
-        # Runs the keystream
-        result = []
-        rune_index = -1
-        try:
-            for rune in processed_text.get_runes():
-                rune_index += 1
-                if rune_index in self._interrupt_indices:
-                    result.append(rune)
-                else:
-                    val = next(self._keystream)
-                    if not self._add:
-                        val *= -1
-                    result.append(RUNES[val % len(RUNES)])
-
-            # Set the result
-            processed_text.set_runes(result)
-        except StopIteration:
-            pass
+        # Use the registered keystream
+        super().__init__(add=add, keystream='mobius_totient_primes', interrupt_indices=interrupt_indices, vectorized=vectorized, use_prime_as_base=use_prime_as_base)
 
 class UnsolvedTransformer(TransformerBase):
     """
@@ -478,9 +858,207 @@ class TransformerSequence(TransformerBase):
     def transform(self, processed_text):
         """
             transforms runes.
+            Once the prefix cache is enabled, intermediate results after transformers that are not affine are cached by content (see PrefixCache),
+            so sequences that share a prefix only run it once per text.
         """
 
-        # Runs all transformers sequentially
+        # Only prefixes that end with a transformer that is not affine are worth caching, as affine ones take a single pass anyway
+        transformers = self.get_transformers()
+        boundaries = [ end for end in range(len(transformers), 0, -1) if not transformers[end - 1].is_affine() ] if _PREFIX_CACHE.is_enabled() else []
+
+        # Purely affine sequences run as is, without building signatures
+        if len(boundaries) == 0:
+            for transformer in transformers:
+                transformer.transform(processed_text)
+            return
+
+        # Signatures are only needed up to the last boundary, and only prefixes with a signature can be cached
+        prefix_signatures = self._get_prefix_signatures(transformers[:boundaries[0]])
+        boundaries = [ end for end in boundaries if end <= len(prefix_signatures) ]
+
+        # Start from the longest cached prefix
+        start = 0
+        if len(boundaries) > 0:
+            digest = get_text_digest(processed_text.view_indices())
+            boundary_index, cached = _PREFIX_CACHE.find(digest, [ prefix_signatures[end - 1] for end in boundaries ])
+            if cached is not None:
+                start = boundaries[boundary_index]
+                processed_text.set_indices(cached)
+
+        # Runs all remaining transformers sequentially, caching new intermediate results
+        for transformer_index in range(start, len(transformers)):
+            transformers[transformer_index].transform(processed_text)
+            if transformer_index + 1 in boundaries:
+                _PREFIX_CACHE.put(digest, prefix_signatures[transformer_index], processed_text.view_indices())
+
+    @staticmethod
+    def _get_prefix_signatures(transformers):
+        """
+            Gets the signature of each prefix of the given transformers, up to the first transformer that has none.
+        """
+
+        # Accumulate
+        result = []
+        for transformer in transformers:
+            transformer_signature = transformer.signature()
+            if transformer_signature is None:
+                break
+            result.append((result[-1] if len(result) > 0 else ()) + (transformer_signature,))
+        return result
+
+    def signature(self):
+        """
+            Gets the signature of the entire sequence, if all transformers have one.
+        """
+
+        # All or nothing
+        transformers = self.get_transformers()
+        prefix_signatures = self._get_prefix_signatures(transformers)
+        return ('Sequence',) + prefix_signatures[-1] if len(prefix_signatures) == len(transformers) and len(transformers) > 0 else None
+
+    def get_transformers(self):
+        """
+            Gets all transformers, flattening nested sequences.
+        """
+
+        # Flatten recursively
+        result = []
         for transformer in self._transformers:
-            transformer.transform(processed_text)
+            if isinstance(transformer, TransformerSequence):
+                result += transformer.get_transformers()
+            else:
+                result.append(transformer)
+        return result
+
+    def is_affine(self):
+        """
+            Indicates whether all transformers are affine.
+        """
+
+        # All must be affine
+        return all([ transformer.is_affine() for transformer in self.get_transformers() ])
+
+    def get_affine(self, length):
+        """
+            Gets the entire sequence as a single affine map.
+        """
+
+        # Compose all maps
+        result = get_identity_affine(length)
+        for transformer in self.get_transformers():
+            result = compose_affine(result, transformer.get_affine(length))
+        return result
+
+    def get_rune_map(self):
+        """
+            Gets the permutation of the alphabet applied by the entire sequence, if all transformers have one.
+        """
+
+        # Compose permutations in order
+        rune_map = np.arange(len(RUNES))
+        for transformer in self.get_transformers():
+            transformer_map = transformer.get_rune_map()
+            if transformer_map is None:
+                return None
+            rune_map = transformer_map[rune_map]
+        return rune_map
+
+    def compile(self):
+        """
+            Compiles the sequence, fusing consecutive affine transformers into single passes.
+        """
+
+        # Group consecutive affine transformers, keeping the others as separate stages
+        stages = []
+        for transformer in self.get_transformers():
+            if not transformer.is_affine():
+                stages.append(transformer)
+            elif len(stages) > 0 and isinstance(stages[-1], _FusedAffineStage):
+                stages[-1].add(transformer)
+            else:
+                stages.append(_FusedAffineStage(transformer))
+        return CompiledTransformerSequence(*stages)
+
+class _FusedAffineStage(TransformerBase):
+    """
+        Consecutive affine transformers fused into a single pass.
+    """
+
+    def __init__(self, transformer):
+        """
+            Creates an instance.
+        """
+
+        # Save the transformers and cache fused maps by text length, along with the fused permutation of the alphabet
+        self._transformers = [ transformer ]
+        self._affine_by_length = {}
+        self._rune_map = None
+
+    def add(self, transformer):
+        """
+            Adds a transformer to the stage.
+        """
+
+        # Add and invalidate the cache
+        self._transformers.append(transformer)
+        self._affine_by_length = {}
+        self._rune_map = None
+
+    def is_affine(self):
+        """
+            Indicates the stage is affine.
+        """
+
+        # Always affine
+        return True
+
+    def get_affine(self, length):
+        """
+            Gets the fused affine map.
+        """
+
+        # Compose once per length
+        if length not in self._affine_by_length:
+            self._affine_by_length[length] = TransformerSequence(*self._transformers).get_affine(length)
+        return self._affine_by_length[length]
+
+    def transform(self, processed_text):
+        """
+            Transforms runes in a single pass.
+        """
+
+        # Apply the fused map
+        indices = processed_text.view_indices()
+        processed_text.set_indices(apply_affine(indices, self.get_affine(len(indices))), self.get_rune_map())
+
+    def get_rune_map(self):
+        """
+            Gets the permutation of the alphabet, if all fused transformers have one.
+        """
+
+        # Compose once
+        if self._rune_map is None:
+            self._rune_map = (TransformerSequence(*self._transformers).get_rune_map(),)
+        return self._rune_map[0]
+
+    def signature(self):
+        """
+            Gets the signature of the fused transformers, if all have one.
+        """
+
+        # Same as the sequence of fused transformers
+        return TransformerSequence(*self._transformers).signature()
+
+class CompiledTransformerSequence(TransformerSequence):
+    """
+        A transformer sequence compiled into fused affine stages and stages that must run on their own (e.g. Autokey).
+    """
+
+    def compile(self):
+        """
+            Already compiled.
+        """
+
+        # Nothing to do
+        return self
 